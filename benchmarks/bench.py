@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmarks for the hot paths of mutmut.
+
+Run them from the root of the repository::
+
+    python benchmarks/bench.py run
+    python benchmarks/bench.py run --quick
+    python benchmarks/bench.py compare benchmarks/results/<old>.json benchmarks/results/<new>.json
+
+``run`` writes the results to ``benchmarks/results/<commit>.json`` so runs can
+be compared across commits with ``compare``. All benchmarks run on synthetic
+corpora of small, huge and deeply nested modules that are generated in a
+temporary directory.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+from io import StringIO
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+sys.path.insert(0, ROOT)
+
+from mutmut import (  # noqa: E402
+    Context,
+    RelativeMutationID,
+    list_mutations,
+    mutate,
+)
+from mutmut import cache  # noqa: E402
+from parso import parse  # noqa: E402
+
+
+# Corpora
+
+function_template = '''\
+def function_{i}(a, b, c=None):
+    if a > b and b != {i}:
+        return a + b * {i}
+    values = [a, b, 'text {i}']
+    while c is not None and c < {i}:
+        c += 1
+    return values[0] - {i} or not c
+'''
+
+
+def small_modules(count):
+    return [
+        ''.join(function_template.format(i=i * 5 + j) for j in range(5))
+        for i in range(count)
+    ]
+
+
+def huge_module(functions):
+    return '\n\n'.join(function_template.format(i=i) for i in range(functions))
+
+
+def nested_module(depth):
+    lines = ['def nested(a, b):']
+    for d in range(depth):
+        indent = '    ' * (d + 1)
+        lines.append('{}a = a * {} - b'.format(indent, d))
+        lines.append('{}if a > {} and b < {}:'.format(indent, d, d + 1))
+    lines.append('{}return a + b'.format('    ' * (depth + 1)))
+    lines.append('    return None')
+    return '\n'.join(lines) + '\n'
+
+
+def lines_module(lines):
+    """A module with ``lines`` distinct lines, for the cache benchmarks
+    that only need lines to hang mutants on."""
+    return ''.join('x_{} = {}\n'.format(i, i) for i in range(lines))
+
+
+def write(filename, source):
+    with open(filename, 'w') as f:
+        f.write(source)
+
+
+@contextmanager
+def workdir():
+    """Run in a fresh directory with an empty mutmut cache."""
+    cwd = os.getcwd()
+    with TemporaryDirectory() as tmpdir:
+        os.chdir(tmpdir)
+        reset_db()
+        try:
+            yield tmpdir
+        finally:
+            reset_db()
+            os.chdir(cwd)
+
+
+def reset_db():
+    cache.db.disconnect()
+    cache.db.provider = None
+    cache.db.schema = None
+
+
+def synthetic_mutants(filename, mutants, mutants_per_line=4):
+    """Register ``mutants`` mutants on a generated file, without paying for
+    finding them with :func:`list_mutations`."""
+    lines = mutants // mutants_per_line
+    source = lines_module(lines)
+    write(filename, source)
+    return [
+        RelativeMutationID(line=line, index=index, line_number=line_number, operator='number')
+        for line_number, line in enumerate(source.splitlines())
+        for index in range(mutants_per_line)
+    ]
+
+
+# Benchmarks
+#
+# Each benchmark does its setup, times the work it measures and returns
+# (seconds, items) where items is what throughput is reported in.
+
+
+def timed(f, *args, **kwargs):
+    start = perf_counter()
+    result = f(*args, **kwargs)
+    return perf_counter() - start, result
+
+
+def bench_list_mutations_small(size):
+    sources = small_modules(size['small_modules'])
+    start = perf_counter()
+    count = sum(len(list_mutations(Context(source=source))) for source in sources)
+    return perf_counter() - start, count
+
+
+def bench_list_mutations_huge(size):
+    source = huge_module(size['huge_functions'])
+    seconds, mutation_ids = timed(list_mutations, Context(source=source))
+    return seconds, len(mutation_ids)
+
+
+def bench_list_mutations_nested(size):
+    source = nested_module(size['nested_depth'])
+    seconds, mutation_ids = timed(list_mutations, Context(source=source))
+    return seconds, len(mutation_ids)
+
+
+def bench_mutate_one_mutant(size):
+    source = huge_module(size['huge_functions'])
+    mutation_ids = list_mutations(Context(source=source))
+    mutation_id = mutation_ids[len(mutation_ids) // 2]
+    seconds, _ = timed(mutate, Context(source=source, mutation_id=mutation_id))
+    return seconds, 1
+
+
+def bench_mutate_reusing_parsed_tree(size):
+    source = huge_module(size['huge_functions'])
+    mutation_ids = list_mutations(Context(source=source))[:100]
+    parsed = parse(source, error_recovery=False)
+    start = perf_counter()
+    for mutation_id in mutation_ids:
+        mutate(Context(source=source, mutation_id=mutation_id), parsed=parsed)
+    return perf_counter() - start, len(mutation_ids)
+
+
+def _bench_register_mutants(mutants):
+    with workdir():
+        mutation_ids = synthetic_mutants('module.py', mutants)
+        cache.update_line_numbers('module.py')
+        seconds, _ = timed(cache.register_mutants, {'module.py': mutation_ids})
+    return seconds, len(mutation_ids)
+
+
+def _bench_get_cached_mutation_statuses(mutants):
+    with workdir():
+        mutation_ids = synthetic_mutants('module.py', mutants)
+        cache.update_line_numbers('module.py')
+        cache.register_mutants({'module.py': mutation_ids})
+        seconds, _ = timed(cache.get_cached_mutation_statuses, 'module.py', mutation_ids, 'tests-hash', 'python -m pytest -x', None)
+    return seconds, len(mutation_ids)
+
+
+def bench_register_mutants_small(size):
+    return _bench_register_mutants(size['cache_small'])
+
+
+def bench_register_mutants_big(size):
+    return _bench_register_mutants(size['cache_big'])
+
+
+def bench_get_cached_mutation_statuses_small(size):
+    return _bench_get_cached_mutation_statuses(size['cache_small'])
+
+
+def bench_get_cached_mutation_statuses_big(size):
+    return _bench_get_cached_mutation_statuses(size['cache_big'])
+
+
+def bench_update_line_numbers_large_diff(size):
+    lines = size['diff_lines']
+    with workdir():
+        source = lines_module(lines).splitlines(keepends=True)
+        write('module.py', ''.join(source))
+        cache.update_line_numbers('module.py')
+
+        # change every 10th line and insert a line every 25 lines
+        changed = []
+        for i, line in enumerate(source):
+            if i % 25 == 0:
+                changed.append('inserted_{} = None\n'.format(i))
+            changed.append('changed_{} = {}\n'.format(i, i) if i % 10 == 0 else line)
+        write('module.py', ''.join(changed))
+        seconds, _ = timed(cache.update_line_numbers, 'module.py')
+    return seconds, lines
+
+
+@contextmanager
+def report_corpus(size):
+    """A cache with the results for a real module, for the reports."""
+    with workdir():
+        source = huge_module(size['report_functions'])
+        write('module.py', source)
+        mutation_ids = list_mutations(Context(source=source))
+        cache.update_line_numbers('module.py')
+        cache.register_mutants({'module.py': mutation_ids})
+        statuses = [cache.OK_KILLED, cache.BAD_SURVIVED, cache.BAD_TIMEOUT, cache.OK_SUSPICIOUS]
+        with cache.db_session:
+            for i, mutant in enumerate(cache.Mutant.select()):
+                mutant.status = statuses[i % len(statuses)]
+                mutant.tested_against_hash = 'tests-hash'
+                mutant.duration = 0.01 * (i % 7)
+        yield len(mutation_ids)
+
+
+def _bench_report(size, f, *args, **kwargs):
+    with report_corpus(size) as count:
+        with redirect_stdout(StringIO()):
+            seconds, _ = timed(f, *args, **kwargs)
+    return seconds, count
+
+
+def bench_report_results(size):
+    return _bench_report(size, cache.print_result_cache)
+
+
+def bench_report_junitxml(size):
+    return _bench_report(size, cache.print_result_cache_junitxml, dict_synonyms=[], suspicious_policy='ignore', untested_policy='ignore')
+
+
+def bench_report_html(size):
+    return _bench_report(size, cache.create_html_report, dict_synonyms=[])
+
+
+def bench_report_export(size):
+    return _bench_report(size, cache.export_results, 'ndjson', [])
+
+
+def bench_end_to_end(size):
+    """Mutants per second of a whole `mutmut run` with a test command that
+    does nothing, so what is left is the overhead of mutmut."""
+    with workdir():
+        write('module.py', huge_module(size['end_to_end_functions']))
+        os.mkdir('tests')
+        write('tests/test_module.py', 'def test_nothing():\n    pass\n')
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        start = perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-m', 'mutmut', 'run', '--paths-to-mutate=module.py', '--runner', '{} -c pass'.format(sys.executable)],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        seconds = perf_counter() - start
+        # every mutant survives `-c pass`, so only the fatal error bit of the exit code means the run failed
+        if result.returncode < 0 or result.returncode & 1:
+            raise click.ClickException('mutmut run exited with {}:\n{}'.format(result.returncode, result.stderr.decode(errors='replace')))
+        reset_db()
+        count = cache.cache_row_counts()['Mutant']
+    return seconds, count
+
+
+benchmarks = {
+    'list_mutations small modules': bench_list_mutations_small,
+    'list_mutations huge module': bench_list_mutations_huge,
+    'list_mutations nested module': bench_list_mutations_nested,
+    'mutate one mutant of huge module': bench_mutate_one_mutant,
+    'mutate reusing parsed tree': bench_mutate_reusing_parsed_tree,
+    'register_mutants {cache_small}': bench_register_mutants_small,
+    'register_mutants {cache_big}': bench_register_mutants_big,
+    'get_cached_mutation_statuses {cache_small}': bench_get_cached_mutation_statuses_small,
+    'get_cached_mutation_statuses {cache_big}': bench_get_cached_mutation_statuses_big,
+    'update_line_numbers large diff': bench_update_line_numbers_large_diff,
+    'report results': bench_report_results,
+    'report junitxml': bench_report_junitxml,
+    'report html': bench_report_html,
+    'report export': bench_report_export,
+    'end to end': bench_end_to_end,
+}
+
+sizes = {
+    'full': dict(
+        small_modules=100,
+        huge_functions=2000,
+        nested_depth=60,
+        cache_small=10_000,
+        cache_big=100_000,
+        diff_lines=20_000,
+        report_functions=300,
+        end_to_end_functions=20,
+    ),
+    'quick': dict(
+        small_modules=10,
+        huge_functions=200,
+        nested_depth=20,
+        cache_small=1_000,
+        cache_big=10_000,
+        diff_lines=2_000,
+        report_functions=30,
+        end_to_end_functions=2,
+    ),
+}
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command()
+@click.option('--quick', is_flag=True, default=False, help='Run on smaller corpora, for a fast sanity check')
+@click.option('--repeat', type=int, default=3, help='Run each benchmark this many times and keep the fastest')
+@click.option('-k', 'only', help='Only run the benchmarks with this in their name')
+@click.option('--output', help='Where to write the results, defaults to benchmarks/results/<commit>.json')
+def run(quick, repeat, only, output):
+    size_name = 'quick' if quick else 'full'
+    size = sizes[size_name]
+    commit = current_commit()
+
+    results = {}
+    for name, f in benchmarks.items():
+        name = name.format(**size)
+        if only and only not in name:
+            continue
+        timings = []
+        items = 0
+        for _ in range(repeat):
+            seconds, items = f(size)
+            timings.append(seconds)
+        seconds = min(timings)
+        results[name] = dict(seconds=seconds, items=items, per_second=items / seconds if seconds else None)
+        print('{:<40} {:>10.4f}s {:>10} items {:>14.1f}/s'.format(name, seconds, items, results[name]['per_second'] or 0))
+
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, '{}{}.json'.format(commit, '-quick' if quick else ''))
+    with open(output, 'w') as f:
+        json.dump(dict(
+            commit=commit,
+            date=datetime.now().isoformat(),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            size=size_name,
+            results=results,
+        ), f, indent=4)
+    print('Results written to {}'.format(output))
+
+
+@main.command()
+@click.argument('before', type=click.File())
+@click.argument('after', type=click.File())
+@click.option('--threshold', type=float, default=0.1, help='Flag changes bigger than this fraction, default 0.1')
+def compare(before, after, threshold):
+    """Compare two result files, exits with 1 if anything got slower than the threshold."""
+    before = json.load(before)
+    after = json.load(after)
+    if before['size'] != after['size']:
+        print('Warning: comparing a {} run with a {} run'.format(before['size'], after['size']))
+
+    print('{:<40} {:>10} {:>10} {:>8}'.format('benchmark', before['commit'], after['commit'], 'change'))
+    regressions = 0
+    for name, result in after['results'].items():
+        if name not in before['results']:
+            continue
+        old = before['results'][name]['seconds']
+        new = result['seconds']
+        change = (new - old) / old if old else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  slower'
+            regressions += 1
+        elif change < -threshold:
+            flag = '  faster'
+        print('{:<40} {:>9.4f}s {:>9.4f}s {:>+7.1%}{}'.format(name, old, new, change, flag))
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
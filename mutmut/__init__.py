@@ -1,29 +1,44 @@
 # -*- coding: utf-8 -*-
+import codecs
+import cProfile
 import fnmatch
 import itertools
+import json
 import multiprocessing
 import os
+import pstats
+import random
 import re
+import selectors
 import shlex
+import signal
+import sqlite3
 import subprocess
 import sys
+from collections import deque
 from configparser import (
     ConfigParser,
     NoOptionError,
     NoSectionError,
 )
+from contextlib import contextmanager
 from copy import copy as copy_obj
-from functools import wraps
+from functools import partial, wraps
+from math import log, sqrt
 from io import (
     open,
     TextIOBase,
 )
 from os.path import isdir
+from queue import Empty, Full
 from shutil import (
     move,
     copy,
 )
+from statistics import median
+from tempfile import TemporaryDirectory
 from threading import (
+    Event,
     Timer,
     Thread,
 )
@@ -32,6 +47,8 @@ from time import time
 from parso import parse
 from parso.python.tree import Name, Number, Keyword
 
+from mutmut import linetracer, pytestplugin
+
 __version__ = '2.1.0'
 
 
@@ -42,11 +59,14 @@ except ImportError:
 
 
 class RelativeMutationID(object):
-    def __init__(self, line, index, line_number, filename=None):
+    def __init__(self, line, index, line_number, filename=None, operator=None):
         self.line = line
         self.index = index
         self.line_number = line_number
         self.filename = filename
+        # The kind of mutation, like 'number' or 'keyword'. Only informational,
+        # it's not part of the identity of the mutant.
+        self.operator = operator
 
     def __repr__(self):
         return 'MutationID(line="{}", index={}, line_number={}, filename={})'.format(self.line, self.index, self.line_number, self.filename)
@@ -180,6 +200,18 @@ class SkipException(Exception):
     pass
 
 
+class ResourceLimitExceeded(Exception):
+    """The test command was stopped by one of the ``resource_limits`` of the
+    :class:`Config`, see :func:`set_resource_limits`."""
+    def __init__(self, reason):
+        if reason == 'killed':
+            message = 'the test command was killed'
+        else:
+            message = 'the test command hit the {}'.format(reason)
+        super(ResourceLimitExceeded, self).__init__(message)
+        self.reason = reason
+
+
 UNTESTED = 'untested'
 OK_KILLED = 'ok_killed'
 OK_SUSPICIOUS = 'ok_suspicious'
@@ -451,23 +483,52 @@ mutations_by_type = {
 # TODO: detect regexes and mutate them in nasty ways? Maybe mutate all strings as if they are regexes
 
 
-def should_exclude(context, config):
-    if config is None or config.covered_lines_by_filename is None:
-        return False
+def covered_lines(config, filename):
+    """The lines of ``filename`` that all of ``config.line_filters`` let
+    through. A line filter takes a filename and returns the lines that may be
+    mutated, or :obj:`None` if none may be.
 
+    :return: the lines of ``filename`` that may be mutated, :obj:`None` if none may be
+    :rtype: set[int] or None
+    """
     try:
-        covered_lines = config.covered_lines_by_filename[context.filename]
+        return config.covered_lines_by_filename[filename]
     except KeyError:
-        if config.coverage_data is not None:
-            covered_lines = config.coverage_data.get(os.path.abspath(context.filename))
-            config.covered_lines_by_filename[context.filename] = covered_lines
-        else:
-            covered_lines = None
+        pass
+
+    result = None
+    for line_filter in config.line_filters or ():
+        lines = set(line_filter(filename) or ())
+        result = lines if result is None else result & lines
+        if not result:
+            # no need to ask the rest of the filters
+            result = None
+            break
+    config.covered_lines_by_filename[filename] = result
+    return result
+
+
+def config_for_file(config, filename):
+    """A copy of ``config`` for a work item that only knows the covered lines
+    of ``filename``, so the work items for the workers don't carry the
+    coverage of the whole project. Make it right before queueing the work
+    item, so it has the latest baseline of the run."""
+    result = copy_obj(config)
+    if config.covered_lines_by_filename is not None:
+        result.covered_lines_by_filename = {filename: covered_lines(config, filename)}
+        result.line_filters = None
+    return result
+
 
-    if covered_lines is None:
+def should_exclude(context, config):
+    if config is None or config.covered_lines_by_filename is None:
+        return False
+
+    covered_lines_of_file = covered_lines(config, context.filename)
+    if covered_lines_of_file is None:
         return True
     current_line = context.current_line_index + 1
-    if current_line not in covered_lines:
+    if current_line not in covered_lines_of_file:
         return True
     return False
 
@@ -480,6 +541,7 @@ class Context(object):
         self._set_source(source)
         self.mutation_id = mutation_id
         self.performed_mutation_ids = []
+        self.applied_mutations = []
         assert isinstance(mutation_id, RelativeMutationID)
         self.current_line_index = 0
         self.filename = filename
@@ -490,10 +552,24 @@ class Context(object):
         self._path_by_line = None
         self.config = config
         self.skip = False
+        # which resource limit killed the mutant, if any
+        self.limit_reason = None
+        # unix times of the phases of testing this mutant: queued, started,
+        # tests_started, tests_finished and finished
+        self.timings = {}
 
     def exclude_line(self):
         return self.current_line_index in self.pragma_no_mutate_lines or should_exclude(context=self, config=self.config)
 
+    def exclude_lines(self, first, last):
+        """
+        :return: :obj:`True` if none of the lines ``first`` to ``last`` (1 based, inclusive) may be mutated
+        """
+        if self.config is None or self.config.covered_lines_by_filename is None:
+            return False
+        lines = covered_lines(self.config, self.filename)
+        return lines is None or not any(line in lines for line in range(first, last + 1))
+
     @property
     def source(self):
         if self._source is None:
@@ -537,20 +613,31 @@ class Context(object):
         return self.mutation_id in (ALL, self.mutation_id_of_current_index)
 
 
-def mutate(context):
+def mutate(context, parsed=None):
     """
     :type context: Context
+    :param parsed: an already parsed tree of ``context.source`` to mutate
+        instead of parsing the source again. The tree is restored afterwards
+        so it can be reused for the next mutant.
     :return: tuple of mutated source code and number of mutations performed
     :rtype: Tuple[str, int]
     """
+    if parsed is None:
+        try:
+            result = parse(context.source, error_recovery=False)
+        except Exception:
+            print('Failed to parse {}. Internal error from parso follows.'.format(context.filename))
+            print('----------------------------------')
+            raise
+    else:
+        result = parsed
     try:
-        result = parse(context.source, error_recovery=False)
-    except Exception:
-        print('Failed to parse {}. Internal error from parso follows.'.format(context.filename))
-        print('----------------------------------')
-        raise
-    mutate_list_of_nodes(result, context=context)
-    mutated_source = result.get_code().replace(' not not ', ' ')
+        mutate_list_of_nodes(result, context=context)
+        mutated_source = result.get_code().replace(' not not ', ' ')
+    finally:
+        if parsed is not None:
+            for node, key, old in reversed(context.applied_mutations):
+                setattr(node, key, old)
     if context.remove_newline_at_end:
         assert mutated_source[-1] == '\n'
         mutated_source = mutated_source[:-1]
@@ -630,7 +717,10 @@ def mutate_node(node, context):
                     if hasattr(mutmut_config, 'pre_mutation_ast'):
                         mutmut_config.pre_mutation_ast(context=context)
                     if context.should_mutate():
-                        context.performed_mutation_ids.append(context.mutation_id_of_current_index)
+                        mutation_id = context.mutation_id_of_current_index
+                        mutation_id.operator = value.__name__[:-len('_mutation')]
+                        context.performed_mutation_ids.append(mutation_id)
+                        context.applied_mutations.append((node, key, old))
                         setattr(node, key, new)
                     context.index += 1
                 # this is just an optimization to stop early
@@ -656,6 +746,12 @@ def mutate_list_of_nodes(node, context):
         if return_annotation_started:
             continue
 
+        # Skip whole statements that can't be mutated. This is only safe for
+        # statements directly in a module or block: those never share a line
+        # with their siblings and their parents have no mutations of their own.
+        if node.type in ('file_input', 'suite') and context.exclude_lines(child_node.start_pos[0], child_node.end_pos[0]):
+            continue
+
         mutate_node(child_node, context=context)
 
         # this is just an optimization to stop early
@@ -682,21 +778,118 @@ def mutate_file(backup, context):
     with open(context.filename) as f:
         original = f.read()
     if backup:
-        with open(context.filename + '.bak', 'w') as f:
+        # Write the backup under a temporary name first: a half written
+        # backup must never be restored by recover_from_journal
+        with open(context.filename + '.bak.tmp', 'w') as f:
             f.write(original)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(context.filename + '.bak.tmp', context.filename + '.bak')
     mutated, _ = mutate(context)
     with open(context.filename, 'w') as f:
         f.write(mutated)
     return original, mutated
 
 
-def queue_mutants(*, progress, config, mutants_queue, mutations_by_file):
-    from mutmut.cache import get_cached_mutation_statuses
+def journal_path():
+    return os.path.join(JOURNAL_DIR, '{}.json'.format(os.getpid()))
+
 
+def journal_begin(filename):
+    """Record on disk that ``filename`` is about to be mutated, so that the
+    original can be restored by :func:`recover_from_journal` if mutmut is
+    killed before the backup has been moved back.
+    """
+    os.makedirs(JOURNAL_DIR, exist_ok=True)
+    path = journal_path()
+    with open(path + '.tmp', 'w') as f:
+        f.write(json.dumps(dict(filename=os.path.abspath(filename))))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def journal_end():
     try:
-        index = 0
+        os.remove(journal_path())
+    except FileNotFoundError:
+        pass
+
+
+def recover_from_journal():
+    """Restore the source files that were left mutated by a mutmut run that
+    was killed while testing a mutant. Journals of processes that are still
+    running are left alone.
+
+    :return: the restored filenames
+    :rtype: list[str]
+    """
+    restored = []
+    if not isdir(JOURNAL_DIR):
+        return restored
+
+    for entry in sorted(os.listdir(JOURNAL_DIR)):
+        path = os.path.join(JOURNAL_DIR, entry)
+        pid = entry.partition('.')[0]
+        if pid.isdigit() and process_alive(int(pid)):
+            # a mutmut run that is still going, the files are its to restore
+            continue
+        if entry.endswith('.json'):
+            with open(path) as f:
+                filename = json.loads(f.read() or '{}').get('filename')
+            if filename and os.path.exists(filename + '.bak'):
+                move(filename + '.bak', filename)
+                restored.append(filename)
+        os.remove(path)
+
+    if not os.listdir(JOURNAL_DIR):
+        os.rmdir(JOURNAL_DIR)
+    return restored
+
+
+def process_alive(pid):
+    """
+    :rtype: bool
+    """
+    if os.name == 'nt':  # pragma: no cover
+        # os.kill would terminate the process on Windows
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def put_unless_stopped(queue, item, stop):
+    """Put ``item`` on ``queue``, unless ``stop`` gets set while waiting
+    for room.
+
+    :rtype: bool
+    """
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            pass
+    return False
+
+
+def queue_mutants(*, progress, config, mutants_queue, mutations_by_file, tracer=None, shuffle_seed=None, stop=None):
+    from mutmut.cache import get_cached_mutation_statuses
+
+    if stop is None:
+        stop = Event()
+
+    def untested_mutants():
         for filename, mutations in mutations_by_file.items():
-            cached_mutation_statuses = get_cached_mutation_statuses(filename, mutations, config.hash_of_tests)
+            start = time()
+            cached_mutation_statuses = get_cached_mutation_statuses(filename, mutations, config.hash_of_tests, config.test_command, config.dict_synonyms)
+            if tracer is not None:
+                tracer.complete('cache lookup ' + filename, 'db', start, time(), tid=Tracer.QUEUE_THREAD, args=dict(mutants=len(mutations)))
             with open(filename) as f:
                 source = f.read()
             for mutation_id in mutations:
@@ -704,25 +897,66 @@ def queue_mutants(*, progress, config, mutants_queue, mutations_by_file):
                 if cached_status != UNTESTED:
                     progress.register(cached_status)
                     continue
-                context = Context(
-                    mutation_id=mutation_id,
-                    filename=filename,
-                    dict_synonyms=config.dict_synonyms,
-                    config=copy_obj(config),
-                    source=source,
-                    index=index,
-                )
-                mutants_queue.put(('mutant', context))
-                index += 1
-    finally:
-        mutants_queue.put(('end', None))
+                yield filename, source, mutation_id
 
+    queue_start = time()
+    index = 0
+    try:
+        mutants = untested_mutants()
+        if shuffle_seed is not None:
+            mutants = list(mutants)
+            random.Random(shuffle_seed).shuffle(mutants)
+        for filename, source, mutation_id in mutants:
+            context = Context(
+                mutation_id=mutation_id,
+                filename=filename,
+                dict_synonyms=config.dict_synonyms,
+                config=config_for_file(config, filename),
+                source=source,
+                index=index,
+            )
+            context.timings['queued'] = time()
+            if not put_unless_stopped(mutants_queue, ('mutant', context), stop):
+                break
+            index += 1
+    finally:
+        put_unless_stopped(mutants_queue, ('end', None), stop)
+        if tracer is not None:
+            tracer.complete('queue_mutants', 'queue', queue_start, time(), tid=Tracer.QUEUE_THREAD, args=dict(queued=index))
+
+
+def check_mutants(mutants_queue, results_queue, cycle_process_after, profile=False):
+    # when the run stops early the main process terminates the worker: exit
+    # through the finally blocks, which kill the tests and restore the source
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+
+    if profile:
+        start_profiling()
+
+    # The test output is kept in a ring buffer instead of sending every line
+    # to the main process: only a heartbeat (or the new output if it's shown)
+    # is sent every PROGRESS_INTERVAL, and the tail is stored for survivors
+    # and timeouts.
+    output = deque(maxlen=OUTPUT_TAIL_LINES)
+    unsent_output = []
+    last_sent = [0.0]
+
+    def send_output(force=False):
+        now = time()
+        if not force and now - last_sent[0] < PROGRESS_INTERVAL:
+            return
+        last_sent[0] = now
+        results_queue.put(('progress', ''.join(unsent_output) or None, None, None, None))
+        unsent_output.clear()
 
-def check_mutants(mutants_queue, results_queue, cycle_process_after):
     def feedback(line):
-        results_queue.put(('progress', line, None, None))
+        output.append(line)
+        if not context.config.swallow_output:
+            unsent_output.append(line)
+        send_output()
 
     did_cycle = False
+    context = None
 
     try:
         count = 0
@@ -731,17 +965,26 @@ def check_mutants(mutants_queue, results_queue, cycle_process_after):
             if command == 'end':
                 break
 
+            results_queue.put(('started', None, context.filename, context.mutation_id, dict(pid=os.getpid())))
+            context.timings['started'] = time()
+            output.clear()
             status = run_mutation(context, feedback)
+            context.timings['finished'] = time()
 
-            results_queue.put(('status', status, context.filename, context.mutation_id))
+            if unsent_output:
+                send_output(force=True)
+            tail = ''.join(output) if status in (BAD_SURVIVED, BAD_TIMEOUT) else ''
+            results_queue.put(('status', status, context.filename, context.mutation_id, dict(timings=context.timings, output=tail, limit_reason=context.limit_reason)))
             count += 1
             if count == cycle_process_after:
-                results_queue.put(('cycle', None, None, None))
+                results_queue.put(('cycle', None, None, None, None))
                 did_cycle = True
                 break
     finally:
+        if profile:
+            stop_profiling('worker')
         if not did_cycle:
-            results_queue.put(('end', None, None, None))
+            results_queue.put(('end', None, None, None, None))
 
 
 def run_mutation(context: Context, callback) -> str:
@@ -769,17 +1012,26 @@ def run_mutation(context: Context, callback) -> str:
         if result and not config.swallow_output:
             callback(result)
 
+    journal_begin(context.filename)
     try:
         mutate_file(
             backup=True,
             context=context
         )
         start = time()
+        context.timings['tests_started'] = start
         try:
             survived = tests_pass(config=config, callback=callback)
         except TimeoutError:
+            context.timings['tests_finished'] = time()
             return BAD_TIMEOUT
+        except ResourceLimitExceeded as e:
+            # a mutant that blows through the limits is as good as killed
+            context.timings['tests_finished'] = time()
+            context.limit_reason = e.reason
+            return OK_KILLED
 
+        context.timings['tests_finished'] = time()
         time_elapsed = time() - start
         if not survived and time_elapsed > config.test_time_base + (config.baseline_time_elapsed * config.test_time_multipler):
             return OK_SUSPICIOUS
@@ -793,6 +1045,7 @@ def run_mutation(context: Context, callback) -> str:
 
     finally:
         move(context.filename + '.bak', context.filename)
+        journal_end()
 
         if config.post_mutation:
             result = subprocess.check_output(config.post_mutation, shell=True).decode().strip()
@@ -800,12 +1053,39 @@ def run_mutation(context: Context, callback) -> str:
                 callback(result)
 
 
+def durations_from_timings(timings):
+    """Turn the timestamps in :attr:`Context.timings` into durations in seconds:
+
+    - ``queue``: waiting in the queue for a worker
+    - ``test``: running the tests
+    - ``mutate``: everything else the worker did: checking the cache, running
+      the hooks, writing the mutant to disk and restoring the original
+
+    Phases that didn't happen, e.g. the tests for a skipped mutant, are None.
+
+    :rtype: dict[str, float or None]
+    """
+    def between(start, end):
+        if start in timings and end in timings:
+            return timings[end] - timings[start]
+        return None
+
+    durations = dict(
+        queue=between('queued', 'started'),
+        test=between('tests_started', 'tests_finished'),
+        mutate=between('started', 'finished'),
+    )
+    if durations['mutate'] is not None and durations['test'] is not None:
+        durations['mutate'] -= durations['test']
+    return durations
+
+
 class Config(object):
     def __init__(self, swallow_output, test_command, covered_lines_by_filename,
                  baseline_time_elapsed, test_time_multiplier, test_time_base,
                  backup, dict_synonyms, total, using_testmon, cache_only,
                  tests_dirs, hash_of_tests, pre_mutation, post_mutation,
-                 coverage_data, paths_to_mutate):
+                 line_filters, paths_to_mutate, resource_limits=None):
         self.swallow_output = swallow_output
         self.test_command = test_command
         self.covered_lines_by_filename = covered_lines_by_filename
@@ -821,8 +1101,9 @@ class Config(object):
         self.hash_of_tests = hash_of_tests
         self.post_mutation = post_mutation
         self.pre_mutation = pre_mutation
-        self.coverage_data = coverage_data
+        self.line_filters = line_filters
         self.paths_to_mutate = paths_to_mutate
+        self.resource_limits = resource_limits
 
 
 def tests_pass(config: Config, callback) -> bool:
@@ -836,12 +1117,102 @@ def tests_pass(config: Config, callback) -> bool:
 
     # Special case for hammett! We can do in-process test running which is much faster
     if use_special_case and config.test_command.startswith(hammett_prefix):
-        return hammett_tests_pass(config, callback)
+        # the tests run in this process, keep them out of the profile of mutmut
+        with profiling_paused():
+            return hammett_tests_pass(config, callback)
 
-    returncode = popen_streaming_output(config.test_command, callback, timeout=config.baseline_time_elapsed * 10)
+    returncode = popen_streaming_output(
+        config.test_command, callback, timeout=mutant_timeout(config), resource_limits=config.resource_limits,
+        passing_returncodes=(0, 5) if config.using_testmon else (0,),
+    )
+    if returncode == pytestplugin.TIMEOUT_EXIT_CODE and os.environ.get(pytestplugin.TIME_LIMITS_ENV):
+        raise TimeoutError('A test took much longer than in the baseline')
     return returncode == 0 or (config.using_testmon and returncode == 5)
 
 
+def selected_tests(test_command, test_durations):
+    """The tests of ``test_durations`` that ``test_command`` selects with
+    paths or node ids on the command line.
+
+    :return: node ids, or None if the command doesn't select tests
+    :rtype: list[str] or None
+    """
+    selectors = []
+    for arg in shlex.split(test_command)[1:]:
+        if arg.startswith('-'):
+            continue
+        if '::' in arg or arg.endswith('.py') or isdir(arg):
+            selectors.append(arg[2:] if arg.startswith('./') else arg)
+    if not selectors:
+        return None
+
+    def is_selected(nodeid):
+        for selector in selectors:
+            if nodeid == selector or nodeid.startswith(selector + '::') or nodeid.startswith(selector.rstrip('/') + '/'):
+                return True
+        return False
+
+    selected = [nodeid for nodeid in test_durations if is_selected(nodeid)]
+    return selected or None
+
+
+def mutant_timeout(config):
+    """Time the tests of a mutant may take: 10 times what the tests that the
+    test command selects took in the baseline, plus the startup time of the
+    test command. Without durations of the tests from the baseline it's 10
+    times the time of the whole test suite.
+    """
+    from mutmut.cache import cached_test_durations
+    timeout = config.baseline_time_elapsed * 10
+    test_durations = cached_test_durations()
+    if not test_durations:
+        return timeout
+
+    selected = selected_tests(config.test_command, test_durations)
+    if selected is None:
+        return timeout
+
+    startup_time = max(config.baseline_time_elapsed - sum(test_durations.values()), 0.0)
+    return (startup_time + sum(test_durations[nodeid] for nodeid in selected)) * 10
+
+
+@contextmanager
+def pytest_plugin_environment(test_command, **variables):
+    """Load :mod:`mutmut.pytestplugin` into ``test_command``, if it runs
+    pytest, with the environment ``variables`` for it. Processes started in
+    this context inherit the environment.
+
+    :return: if the plugin is loaded
+    """
+    if 'pytest' not in test_command and 'py.test' not in test_command:
+        yield False
+        return
+
+    with TemporaryDirectory() as plugin_dir:
+        copy(pytestplugin.__file__, os.path.join(plugin_dir, PYTEST_PLUGIN_MODULE + '.py'))
+        with environment(
+            PYTHONPATH=os.pathsep.join(x for x in [plugin_dir, os.environ.get('PYTHONPATH')] if x),
+            PYTEST_ADDOPTS=' '.join(x for x in [os.environ.get('PYTEST_ADDOPTS'), '-p ' + PYTEST_PLUGIN_MODULE] if x),
+            **variables
+        ):
+            yield True
+
+
+@contextmanager
+def environment(**variables):
+    """Set environment variables, for the processes started in this context."""
+    old_environ = {name: os.environ.get(name) for name in variables}
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        for name, value in old_environ.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
 def config_from_setup_cfg(**defaults):
     def decorator(f):
         @wraps(f)
@@ -910,7 +1281,15 @@ def guess_paths_to_mutate():
 
 
 class Progress(object):
-    def __init__(self, total):
+    """Counts the statuses of the mutants and shows them.
+
+    Redrawing the status line for every mutant and every line of test output
+    can cost more than the tests of a fast test suite, so the status line is
+    redrawn at most every ``interval`` seconds. When stdout is not a terminal,
+    e.g. in CI logs, a summary line is printed every ``summary_interval``
+    seconds instead. Call :meth:`finish` to print the final counts.
+    """
+    def __init__(self, total, interval=0.1, summary_interval=10.0, is_tty=None):
         self.total = total
         self.progress = 0
         self.skipped = 0
@@ -918,9 +1297,28 @@ class Progress(object):
         self.surviving_mutants = 0
         self.surviving_mutants_timeout = 0
         self.suspicious_mutants = 0
+        self.interval = interval
+        self.summary_interval = summary_interval
+        if is_tty is None:
+            is_tty = getattr(sys.stdout, 'isatty', lambda: False)()
+        self.is_tty = is_tty
+        self.last_print = 0.0
+
+    def status_line(self):
+        return '{}/{}  🎉 {}  ⏰ {}  🤔 {}  🙁 {}  🔇 {}'.format(self.progress, self.total, self.killed_mutants, self.surviving_mutants_timeout, self.suspicious_mutants, self.surviving_mutants, self.skipped)
+
+    def print(self, force=False):
+        now = time()
+        if not force and now - self.last_print < (self.interval if self.is_tty else self.summary_interval):
+            return
+        self.last_print = now
+        if self.is_tty:
+            print_status(self.status_line())
+        else:
+            print(self.status_line(), flush=True)
 
-    def print(self):
-        print_status('{}/{}  🎉 {}  ⏰ {}  🤔 {}  🙁 {}  🔇 {}'.format(self.progress, self.total, self.killed_mutants, self.surviving_mutants_timeout, self.suspicious_mutants, self.surviving_mutants, self.skipped))
+    def finish(self):
+        self.print(force=True)
 
     def register(self, status):
         if status == BAD_SURVIVED:
@@ -939,10 +1337,233 @@ class Progress(object):
         self.print()
 
 
+class StatusFile(object):
+    """A JSON file with the live state of a run (throughput, ETA, what each
+    worker is doing, queue depths and status counts) that is rewritten at
+    most every ``interval`` seconds, so long runs can be monitored from the
+    outside.
+    """
+    def __init__(self, path, progress, interval=1.0):
+        self.path = path
+        self.progress = progress
+        self.interval = interval
+        self.start_time = time()
+        self.last_write = 0.0
+        self.tested = 0
+        self.current_mutant_by_worker = {}
+        self.queues = {}
+
+    def worker_started_mutant(self, pid, filename, mutation_id):
+        self.current_mutant_by_worker[pid] = (filename, mutation_id, time())
+
+    def worker_finished_mutant(self, pid):
+        self.current_mutant_by_worker[pid] = None
+        self.tested += 1
+
+    def worker_stopped(self, pid):
+        self.current_mutant_by_worker.pop(pid, None)
+
+    def update(self, force=False):
+        now = time()
+        if not force and now - self.last_write < self.interval:
+            return
+        self.last_write = now
+
+        elapsed = now - self.start_time
+        mutants_per_second = self.tested / elapsed if elapsed else 0.0
+        remaining = self.progress.total - self.progress.progress
+
+        def qsize(q):
+            try:
+                return q.qsize()
+            except NotImplementedError:  # pragma: no cover (macOS)
+                return None
+
+        workers = []
+        for pid, current in sorted(self.current_mutant_by_worker.items()):
+            worker = dict(pid=pid, mutant=None, elapsed=None)
+            if current is not None:
+                filename, mutation_id, started = current
+                worker['mutant'] = dict(filename=filename, line_number=mutation_id.line_number + 1, line=mutation_id.line, index=mutation_id.index)
+                worker['elapsed'] = now - started
+            workers.append(worker)
+
+        status = dict(
+            updated=now,
+            elapsed=elapsed,
+            total=self.progress.total,
+            done=self.progress.progress,
+            tested_this_run=self.tested,
+            mutants_per_second=mutants_per_second,
+            eta_seconds=remaining / mutants_per_second if mutants_per_second else None,
+            counts=dict(
+                killed=self.progress.killed_mutants,
+                timeout=self.progress.surviving_mutants_timeout,
+                suspicious=self.progress.suspicious_mutants,
+                survived=self.progress.surviving_mutants,
+                skipped=self.progress.skipped,
+            ),
+            workers=workers,
+            queues={name: qsize(q) for name, q in self.queues.items()},
+        )
+        with open(self.path + '.tmp', 'w') as f:
+            f.write(json.dumps(status, indent=4))
+        os.replace(self.path + '.tmp', self.path)
+
+
+class Tracer(object):
+    """Collects a timeline of a run in the Chrome trace event format, which
+    can be opened in ``chrome://tracing`` or https://ui.perfetto.dev to see
+    what the main process, the queue thread and each worker were doing.
+    """
+    MAIN_THREAD = 1
+    QUEUE_THREAD = 2
+    WORKER_THREAD = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.start_time = time()
+        self.events = []
+        self.thread_name(self.pid, self.MAIN_THREAD, 'main')
+        self.thread_name(self.pid, self.QUEUE_THREAD, 'queue_mutants')
+
+    def timestamp(self, t):
+        return (t - self.start_time) * 1e6
+
+    def thread_name(self, pid, tid, name):
+        self.events.append(dict(name='thread_name', ph='M', pid=pid, tid=tid, args=dict(name=name)))
+
+    def complete(self, name, cat, start, end, pid=None, tid=MAIN_THREAD, args=None):
+        self.events.append(dict(
+            name=name,
+            cat=cat,
+            ph='X',
+            ts=self.timestamp(start),
+            dur=(end - start) * 1e6,
+            pid=self.pid if pid is None else pid,
+            tid=tid,
+            args=args or {},
+        ))
+
+    def instant(self, name, cat, pid=None, tid=MAIN_THREAD, args=None):
+        self.events.append(dict(
+            name=name,
+            cat=cat,
+            ph='i',
+            s='p',
+            ts=self.timestamp(time()),
+            pid=self.pid if pid is None else pid,
+            tid=tid,
+            args=args or {},
+        ))
+
+    @contextmanager
+    def span(self, name, cat, tid=MAIN_THREAD, **args):
+        start = time()
+        try:
+            yield
+        finally:
+            self.complete(name, cat, start, time(), tid=tid, args=args)
+
+    def worker_started(self, pid):
+        self.thread_name(pid, self.WORKER_THREAD, 'check_mutants')
+
+    def mutant(self, pid, filename, mutation_id, status, timings):
+        """Add the phases of testing one mutant on a worker, from the
+        timestamps in :attr:`Context.timings`."""
+        def phase(name, start, end, args=None):
+            if start in timings and end in timings:
+                self.complete(name, 'mutant', timings[start], timings[end], pid=pid, tid=self.WORKER_THREAD, args=args)
+
+        phase('{}:{}'.format(filename, mutation_id.line_number + 1), 'started', 'finished', args=dict(
+            filename=filename,
+            line=mutation_id.line,
+            index=mutation_id.index,
+            status=status,
+            queue_seconds=durations_from_timings(timings)['queue'],
+        ))
+        phase('mutate', 'started', 'tests_started')
+        phase('tests', 'tests_started', 'tests_finished')
+        phase('restore', 'tests_finished', 'finished')
+
+    def write(self):
+        with open(self.path, 'w') as f:
+            json.dump(dict(traceEvents=self.events, displayTimeUnit='ms'), f)
+
+
+class BaselineMonitor(object):
+    """Watches the test times of the mutants for signs that the machine got
+    slower than when the baseline was measured, e.g. because of other jobs
+    on a CI host, and raises ``config.baseline_time_elapsed`` to match, so
+    the slowdown doesn't turn into suspicious and timed out mutants.
+
+    Survivors run the whole test suite, so their times are compared with
+    the baseline directly. Killed mutants usually stop at the first failing
+    test, so their times only show drift when they are slower than the
+    whole baseline. Suspicious mutants are left out: they are the slow
+    mutants that the baseline is there to catch.
+    """
+    def __init__(self, config, dispersion=0.0, window=20, minimum_samples=5):
+        self.config = config
+        self.dispersion = dispersion
+        self.minimum_samples = minimum_samples
+        self.full_runs = deque(maxlen=window)
+        self.killed_runs = deque(maxlen=window)
+
+    def threshold(self):
+        baseline = self.config.baseline_time_elapsed
+        return baseline + max(3 * self.dispersion, 0.5 * baseline)
+
+    def register(self, status, duration):
+        """
+        :return: the new baseline time, if it was recalibrated
+        :rtype: float or None
+        """
+        if duration is None:
+            return None
+        if status == BAD_SURVIVED:
+            self.full_runs.append(duration)
+        elif status == OK_KILLED:
+            self.killed_runs.append(duration)
+        else:
+            return None
+
+        observed = [
+            median(runs)
+            for runs in (self.full_runs, self.killed_runs)
+            if len(runs) >= self.minimum_samples
+        ]
+        if not observed or max(observed) <= self.threshold():
+            return None
+
+        self.config.baseline_time_elapsed = max(observed)
+        self.full_runs.clear()
+        self.killed_runs.clear()
+        return self.config.baseline_time_elapsed
+
+
 def check_coverage_data_filepaths(coverage_data):
-    for filepath in coverage_data:
-        if not os.path.exists(filepath):
-            raise ValueError('Filepaths in .coverage not recognized, try recreating the .coverage file manually.')
+    # the paths are all relative to the same root, so it's enough to find one of them
+    if not any(os.path.exists(filepath) for filepath in coverage_data):
+        raise ValueError('Filepaths in .coverage not recognized, try recreating the .coverage file manually.')
+
+
+def check_collected_coverage(coverage_data, paths_to_mutate):
+    """Make sure ``--collect-coverage`` saw some code to mutate run, or all
+    mutants would be skipped as not covered.
+
+    :type coverage_data: CoverageIndex
+    :type paths_to_mutate: list[str]
+    """
+    roots = [os.path.abspath(path) for path in paths_to_mutate]
+    for filename in coverage_data:
+        if any(filename == root or filename.startswith(os.path.join(root, '')) for root in roots) and coverage_data.get(filename):
+            return
+    raise RuntimeError(
+        'No lines of {} ran while collecting coverage. If the tests run with coverage.py, e.g. with '
+        'pytest-cov, it may have replaced the tracer of mutmut, try it without or with COVERAGE_CORE=pytrace.'.format(', '.join(paths_to_mutate))
+    )
 
 
 def get_mutations_by_file_from_cache(mutation_pk):
@@ -951,7 +1572,266 @@ def get_mutations_by_file_from_cache(mutation_pk):
     return {filename: [mutation_id]}
 
 
-def popen_streaming_output(cmd, callback, timeout=None):
+def set_resource_limits(resource_limits):
+    """Apply limits to the current process with :func:`resource.setrlimit`.
+
+    :param resource_limits: the maximum ``address_space`` in bytes, ``cpu``
+        time in seconds and number of ``processes``. Note that the limit on
+        processes counts all processes of the user, not just the tests.
+    :type resource_limits: dict[str, int]
+    """
+    import resource
+    for name, value in resource_limits.items():
+        if name == 'cpu':
+            # SIGXCPU at the soft limit, SIGKILL a second later
+            resource.setrlimit(resource.RLIMIT_CPU, (value, value + 1))
+        elif name == 'address_space':
+            resource.setrlimit(resource.RLIMIT_AS, (value, value))
+        elif name == 'processes':
+            resource.setrlimit(resource.RLIMIT_NPROC, (value, value))
+        else:
+            raise ValueError('Unknown resource limit: {}'.format(name))
+
+
+# What the end of the output of a failed test command looks like when it ran
+# into a limit: each limit has groups of strings, and all strings of a group
+# must be in the tail of the output
+resource_limit_markers = {
+    'address_space': [('MemoryError',), ('Cannot allocate memory',)],
+    # EAGAIN alone could be any non-blocking IO
+    'processes': [('Resource temporarily unavailable', 'fork'), ("can't start new thread",)],
+}
+
+LIMIT_MARKER_TAIL_LINES = 20
+
+
+class SupervisedProcess(object):
+    """A test command started by :class:`Supervisor`."""
+    def __init__(self, cmd, callback, timeout, resource_limits=None, passing_returncodes=(0,)):
+        self.cmd = cmd
+        self.callback = callback
+        self.deadline = None if timeout is None else time() + timeout
+        self.resource_limits = resource_limits or {}
+        self.passing_returncodes = passing_returncodes
+        self.tail = deque(maxlen=LIMIT_MARKER_TAIL_LINES)
+        self.timed_out = False
+        self.returncode = None
+        self.cpu_time = None
+        self.reaped = None
+        self.eof = False
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.partial_line = ''
+
+        master, slave = os.openpty()
+        try:
+            # A session of its own makes the command the leader of a new
+            # process group, so grandchildren can be killed along with it
+            self.process = subprocess.Popen(
+                shlex.split(cmd, posix=True),
+                stdout=slave,
+                stderr=slave,
+                start_new_session=True,
+                preexec_fn=partial(set_resource_limits, self.resource_limits) if self.resource_limits else None,
+            )
+        except BaseException:
+            os.close(master)
+            raise
+        finally:
+            os.close(slave)
+        self.master = master
+        os.set_blocking(master, False)
+        # the group outlives the pid if the command gets reaped early
+        self.pgid = self.process.pid
+
+        pidfd_open = getattr(os, 'pidfd_open', None)
+        try:
+            self.pidfd = pidfd_open(self.process.pid) if pidfd_open else None
+        except OSError:  # pragma: no cover (kernel without pidfd support)
+            self.pidfd = None
+
+    def feed(self, data, final=False):
+        text = self.partial_line + self.decoder.decode(data, final=final)
+        lines = text.split('\n')
+        self.partial_line = lines.pop()
+        for line in lines:
+            # the pty turns \n into \r\n
+            if line.endswith('\r'):
+                line = line[:-1]
+            self.tail.append(line)
+            self.callback(line + '\n')
+        if final and self.partial_line:
+            self.tail.append(self.partial_line)
+            self.callback(self.partial_line)
+            self.partial_line = ''
+
+    def limit_in_output(self, name):
+        tail = '\n'.join(self.tail)
+        return any(all(marker in tail for marker in group) for group in resource_limit_markers[name])
+
+    @property
+    def limit_reason(self):
+        """The resource limit the command failed on, or None."""
+        if not self.resource_limits or self.timed_out or self.returncode is None or self.returncode in self.passing_returncodes:
+            return None
+        if 'cpu' in self.resource_limits:
+            if self.returncode == -signal.SIGXCPU:
+                return 'cpu limit'
+            # the kernel sends SIGKILL at the hard limit, anyone else can too
+            if self.returncode == -signal.SIGKILL and self.cpu_time is not None and self.cpu_time >= self.resource_limits['cpu']:
+                return 'cpu limit'
+        if 'address_space' in self.resource_limits and self.limit_in_output('address_space'):
+            return 'memory limit'
+        if 'processes' in self.resource_limits and self.limit_in_output('processes'):
+            return 'process limit'
+        if self.returncode == -signal.SIGKILL:
+            return 'killed'
+        return None
+
+    def read(self):
+        """Read what's available, return False at the end of the output."""
+        try:
+            data = os.read(self.master, 65536)
+        except BlockingIOError:
+            return True
+        except OSError:
+            # EIO: every process with the pty open has closed it
+            data = b''
+        if not data:
+            self.eof = True
+            return False
+        self.feed(data)
+        return True
+
+    def kill(self):
+        try:
+            os.killpg(self.pgid, signal.SIGKILL)
+        except OSError:  # ESRCH: the whole group is gone already
+            pass
+
+    def exited(self):
+        """Check if the command exited. Where :func:`os.waitid` is available
+        it isn't reaped yet: until it's reaped its process group id can't be
+        reused, so the group can still be killed safely."""
+        if self.reaped is not None:
+            return True
+        if hasattr(os, 'waitid'):
+            try:
+                return os.waitid(os.P_PID, self.process.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+            except ChildProcessError:
+                return True
+        try:
+            pid, status, rusage = os.wait4(self.process.pid, os.WNOHANG)
+        except ChildProcessError:
+            return True
+        if pid == 0:
+            return False
+        self.reaped = status, rusage
+        return True
+
+    def wait(self):
+        """Reap the command, along with the CPU time it used."""
+        if self.reaped is None:
+            try:
+                _, status, rusage = os.wait4(self.process.pid, 0)
+            except ChildProcessError:
+                self.process.wait()
+            else:
+                self.reaped = status, rusage
+        if self.reaped is not None:
+            status, rusage = self.reaped
+            self.cpu_time = rusage.ru_utime + rusage.ru_stime
+            self.process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        self.returncode = self.process.returncode
+
+    def finish(self):
+        # The process group is gone by now, so what's left is the output
+        # buffered in the pty. Processes that left the group can keep the pty
+        # open for as long as they like, so don't wait for the end of it.
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.master, selectors.EVENT_READ)
+            while not self.eof and selector.select(FINISH_READ_TIMEOUT) and self.read():
+                pass
+        self.feed(b'', final=True)
+        os.close(self.master)
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+
+
+class Supervisor(object):
+    """Runs test commands and streams their output from a single thread.
+
+    Each command gets a pty for its output and its own process group. The
+    supervisor waits on the ptys and on process exit with a selector instead
+    of polling, and on timeout kills the whole process group, including
+    grandchildren like pytest-xdist workers.
+
+    Waiting for process exit needs :func:`os.pidfd_open` (Linux); elsewhere
+    the processes are polled every :attr:`poll_interval` seconds.
+    """
+    poll_interval = 0.05
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.running = []
+
+    def spawn(self, cmd, callback, timeout=None, resource_limits=None, passing_returncodes=(0,)):
+        """
+        :rtype: SupervisedProcess
+        """
+        supervised = SupervisedProcess(cmd, callback, timeout, resource_limits, passing_returncodes)
+        self.selector.register(supervised.master, selectors.EVENT_READ, (supervised, 'output'))
+        if supervised.pidfd is not None:
+            self.selector.register(supervised.pidfd, selectors.EVENT_READ, (supervised, 'exit'))
+        self.running.append(supervised)
+        return supervised
+
+    def _unregister(self, fd):
+        try:
+            self.selector.unregister(fd)
+        except (KeyError, ValueError):
+            pass
+
+    def run(self):
+        """Supervise the spawned processes until all of them are done."""
+        try:
+            while self.running:
+                now = time()
+                deadlines = [p.deadline for p in self.running if p.deadline is not None and not p.timed_out]
+                wait = max(min(deadlines) - now, 0) if deadlines else None
+                if any(p.pidfd is None for p in self.running):
+                    wait = self.poll_interval if wait is None else min(wait, self.poll_interval)
+
+                for key, _ in self.selector.select(wait):
+                    supervised, what = key.data
+                    if what == 'output':
+                        if not supervised.read():
+                            self._unregister(supervised.master)
+                    else:
+                        self._unregister(supervised.pidfd)
+
+                now = time()
+                for supervised in list(self.running):
+                    if supervised.deadline is not None and now >= supervised.deadline and not supervised.timed_out:
+                        supervised.timed_out = True
+                        supervised.kill()
+                    if supervised.exited():
+                        self._done(supervised)
+        finally:
+            for supervised in list(self.running):
+                self._done(supervised)
+
+    def _done(self, supervised):
+        # leftovers like servers started by the tests must not outlive them
+        supervised.kill()
+        supervised.wait()
+        self._unregister(supervised.master)
+        if supervised.pidfd is not None:
+            self._unregister(supervised.pidfd)
+        self.running.remove(supervised)
+        supervised.finish()
+
+
+def popen_streaming_output(cmd, callback, timeout=None, resource_limits=None, passing_returncodes=(0,)):
     """Open a subprocess and stream its output without hard-blocking.
 
     :param cmd: the command to execute within the subprocess
@@ -964,28 +1844,45 @@ def popen_streaming_output(cmd, callback, timeout=None):
     :param timeout: the timeout time of the subprocess
     :type timeout: float
 
+    :param resource_limits: limits for the subprocess, see
+        :func:`set_resource_limits`. Not supported on Windows.
+    :type resource_limits: dict[str, int]
+
+    :param passing_returncodes: the return codes of a successful run, these
+        never count as running into a limit
+    :type passing_returncodes: tuple[int]
+
     :raises TimeoutError: if the subprocess' execution time exceeds
         the timeout time
 
+    :raises ResourceLimitExceeded: if the subprocess failed because it
+        ran into one of the ``resource_limits``
+
     :return: the return code of the executed subprocess
     :rtype: int
     """
     if os.name == 'nt':  # pragma: no cover
-        process = subprocess.Popen(
-            shlex.split(cmd),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        stdout = process.stdout
-    else:
-        master, slave = os.openpty()
-        process = subprocess.Popen(
-            shlex.split(cmd, posix=True),
-            stdout=slave,
-            stderr=slave
-        )
-        stdout = os.fdopen(master)
-        os.close(slave)
+        return _popen_streaming_output_windows(cmd, callback, timeout)
+
+    supervisor = Supervisor()
+    supervised = supervisor.spawn(cmd, callback, timeout=timeout, resource_limits=resource_limits, passing_returncodes=passing_returncodes)
+    supervisor.run()
+    if supervised.timed_out:
+        raise TimeoutError("subprocess running command '{}' timed out after {} seconds".format(cmd, timeout))
+    if supervised.limit_reason is not None:
+        raise ResourceLimitExceeded(supervised.limit_reason)
+    return supervised.returncode
+
+
+def _popen_streaming_output_windows(cmd, callback, timeout):  # pragma: no cover
+    """Windows has no ptys, process groups or selectors on pipes, so here the
+    output is read with a blocking readline and a timer kills the process."""
+    process = subprocess.Popen(
+        shlex.split(cmd),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    stdout = process.stdout
 
     def kill(process_):
         """Kill the specified process on Timer completion"""
@@ -994,30 +1891,19 @@ def popen_streaming_output(cmd, callback, timeout=None):
         except OSError:
             pass
 
-    # python 2-3 agnostic process timer
     timer = Timer(timeout, kill, [process])
-    timer.setDaemon(True)
+    timer.daemon = True
     timer.start()
 
     while process.returncode is None:
         try:
-            if os.name == 'nt':  # pragma: no cover
-                line = stdout.readline()
-                # windows gives readline() raw stdout as a b''
-                # need to decode it
-                line = line.decode("utf-8")
-                if line:  # ignore empty strings and None
-                    callback(line)
-            else:
-                while True:
-                    line = stdout.readline()
-                    if not line:
-                        break
-                    callback(line)
+            line = stdout.readline()
+            # windows gives readline() raw stdout as a b''
+            # need to decode it
+            line = line.decode("utf-8")
+            if line:  # ignore empty strings and None
+                callback(line)
         except (IOError, OSError):
-            # This seems to happen on some platforms, including TravisCI.
-            # It seems like it's ok to just let this pass here, you just
-            # won't get as nice feedback.
             pass
         if not timer.is_alive():
             raise TimeoutError("subprocess running command '{}' timed out after {} seconds".format(cmd, timeout))
@@ -1050,7 +1936,7 @@ def hammett_tests_pass(config, callback):
         timed_out = True
 
     assert current_thread() is main_thread()
-    timer = Timer(config.baseline_time_elapsed * 10, timeout)
+    timer = Timer(mutant_timeout(config), timeout)
     timer.daemon = True
     timer.start()
 
@@ -1083,19 +1969,32 @@ def hammett_tests_pass(config, callback):
     return returncode == 0
 
 
-def run_mutation_tests(config, progress, mutations_by_file):
+def run_mutation_tests(config, progress, mutations_by_file, status_file=None, tracer=None, profile=False, sequential_test=None, shuffle_seed=None):
     """
     :type config: Config
     :type progress: Progress
     :type mutations_by_file: dict[str, list[RelativeMutationID]]
+    :param status_file: path of a JSON file to keep updated with the state
+        of the run, see :class:`StatusFile`
+    :type status_file: str or None
+    :type tracer: Tracer or None
+    :param profile: if :obj:`True` the workers write cProfile stats to
+        :data:`PROFILE_DIR`
+    :type profile: bool
+    :param sequential_test: stop as soon as it has a verdict, the mutants
+        that are left stay untested
+    :type sequential_test: SequentialTest or None
+    :param shuffle_seed: test the mutants in a random order with this seed
+    :type shuffle_seed: int or None
     """
-    from mutmut.cache import update_mutant_status
+    from mutmut.cache import update_mutant_status, cached_test_time_dispersion
 
     # Need to explicitly use the spawn method for python < 3.8 on macOS
     mp_ctx = multiprocessing.get_context('spawn')
 
     mutants_queue = mp_ctx.Queue(maxsize=100)
     add_to_active_queues(mutants_queue)
+    stop_queueing = Event()
     queue_mutants_thread = Thread(
         target=queue_mutants,
         name='queue_mutants',
@@ -1105,6 +2004,9 @@ def run_mutation_tests(config, progress, mutations_by_file):
             config=config,
             mutants_queue=mutants_queue,
             mutations_by_file=mutations_by_file,
+            tracer=tracer,
+            shuffle_seed=shuffle_seed,
+            stop=stop_queueing,
         )
     )
     queue_mutants_thread.start()
@@ -1121,25 +2023,52 @@ def run_mutation_tests(config, progress, mutations_by_file):
                 mutants_queue=mutants_queue,
                 results_queue=results_queue,
                 cycle_process_after=100,
+                profile=profile,
             )
         )
         t.start()
+        if tracer is not None:
+            tracer.worker_started(t.pid)
         return t
 
+    baseline_monitor = BaselineMonitor(config, dispersion=cached_test_time_dispersion())
+
+    if status_file is not None:
+        status_file = StatusFile(status_file, progress)
+        status_file.queues = dict(mutants=mutants_queue, results=results_queue)
+
     t = create_worker()
 
     while t.is_alive():
-        command, status, filename, mutation_id = results_queue.get()
+        if status_file is not None:
+            status_file.update()
+            try:
+                command, status, filename, mutation_id, data = results_queue.get(timeout=status_file.interval)
+            except Empty:
+                continue
+        else:
+            command, status, filename, mutation_id, data = results_queue.get()
+
         if command == 'end':
             t.join()
             break
 
         elif command == 'cycle':
+            if status_file is not None:
+                status_file.worker_stopped(t.pid)
+            if tracer is not None:
+                tracer.instant('respawn worker', 'worker', args=dict(pid=t.pid))
             t = create_worker()
 
+        elif command == 'started':
+            if status_file is not None:
+                status_file.worker_started_mutant(data['pid'], filename, mutation_id)
+
         elif command == 'progress':
             if not config.swallow_output:
-                print(status, end='', flush=True)
+                if status is not None:
+                    # flushed by the next redraw of the progress
+                    print(status, end='')
             else:
                 progress.print()
 
@@ -1147,15 +2076,256 @@ def run_mutation_tests(config, progress, mutations_by_file):
             assert command == 'status'
 
             progress.register(status)
-
-            update_mutant_status(file_to_mutate=filename, mutation_id=mutation_id, status=status, tests_hash=config.hash_of_tests)
+            if status_file is not None:
+                status_file.worker_finished_mutant(t.pid)
+            if tracer is not None:
+                tracer.mutant(t.pid, filename, mutation_id, status, data['timings'])
+
+            start = time()
+            update_mutant_status(file_to_mutate=filename, mutation_id=mutation_id, status=status, tests_hash=config.hash_of_tests, test_command=config.test_command, dict_synonyms=config.dict_synonyms, durations=durations_from_timings(data['timings']), output=data['output'], limit_reason=data['limit_reason'] or '')
+            if tracer is not None:
+                tracer.complete('update_mutant_status', 'db', start, time())
+
+            recalibrated = baseline_monitor.register(status, durations_from_timings(data['timings'])['test'])
+            if recalibrated is not None:
+                print('\nThe tests got slower than in the baseline, using {:.3f}s as the baseline time from now on'.format(recalibrated))
+                if tracer is not None:
+                    tracer.instant('recalibrate baseline', 'baseline', args=dict(baseline_time_elapsed=recalibrated))
+
+            if sequential_test is not None and sequential_test.verdict(progress) is not None:
+                stop_queueing.set()
+                stop_worker(t)
+                queue_mutants_thread.join()
+                abandon_queue(mutants_queue)
+                abandon_queue(results_queue)
+                if tracer is not None:
+                    tracer.instant('stop early', 'worker', args=dict(verdict=sequential_test.verdict(progress)))
+                break
 
             progress.print()
 
+    progress.finish()
 
-def read_coverage_data():
+    if status_file is not None:
+        status_file.current_mutant_by_worker.clear()
+        status_file.update(force=True)
+
+
+def stop_worker(worker):
+    """Stop a worker in the middle of a mutant. It restores the source
+    file itself, and if it doesn't get to it the journal has the backup."""
+    worker.terminate()
+    worker.join(5)
+    if worker.is_alive():
+        worker.kill()
+        worker.join()
+    recover_from_journal()
+
+
+def abandon_queue(queue):
+    """Throw away what is left in a queue nobody reads anymore, and don't
+    wait at exit for its feeder thread to write the rest into the pipe."""
+    try:
+        while True:
+            queue.get_nowait()
+    except Empty:
+        pass
+    queue.cancel_join_thread()
+
+
+class SequentialTest(object):
+    """Wald's sequential probability ratio test of the mutation score: is it
+    at most ``fail_under`` or at least ``pass_over``? Scores in between are
+    too close to call, so the closer they are the more mutants it takes to
+    get a verdict. Killed and suspicious mutants count as killed, skipped
+    mutants don't count at all.
+
+    :param fail_under: mutation score between 0 and 1
+    :param pass_over: mutation score between ``fail_under`` and 1
+    :param confidence: the chance of the verdict being right, if the score
+        is not in between
+    """
+    PASSED = 'passed'
+    FAILED = 'failed'
+
+    def __init__(self, fail_under, pass_over, confidence=0.95):
+        if not 0 < fail_under < pass_over < 1:
+            raise ValueError('The thresholds must be 0 < fail under < pass over < 1')
+        if not 0.5 < confidence < 1:
+            raise ValueError('The confidence must be between 0.5 and 1')
+        self.fail_under = fail_under
+        self.pass_over = pass_over
+        error = 1 - confidence
+        self.killed_weight = log(pass_over / fail_under)
+        self.survived_weight = log((1 - pass_over) / (1 - fail_under))
+        self.upper_bound = log((1 - error) / error)
+        self.lower_bound = log(error / (1 - error))
+
+    def log_likelihood_ratio(self, progress):
+        killed = progress.killed_mutants + progress.suspicious_mutants
+        survived = progress.surviving_mutants + progress.surviving_mutants_timeout
+        return killed * self.killed_weight + survived * self.survived_weight
+
+    def verdict(self, progress):
+        """
+        :type progress: Progress
+        :return: :attr:`PASSED`, :attr:`FAILED` or :obj:`None` if it's too early to tell
+        """
+        ratio = self.log_likelihood_ratio(progress)
+        if ratio >= self.upper_bound:
+            return self.PASSED
+        if ratio <= self.lower_bound:
+            return self.FAILED
+        return None
+
+    def final_verdict(self, progress):
+        """The verdict once every mutant is tested, which compares the score
+        with the middle of the two thresholds if it's still too close to call.
+        """
+        result = self.verdict(progress)
+        if result is not None:
+            return result
+        killed = progress.killed_mutants + progress.suspicious_mutants
+        tested = killed + progress.surviving_mutants + progress.surviving_mutants_timeout
+        if tested and killed / tested >= (self.fail_under + self.pass_over) / 2:
+            return self.PASSED
+        return self.FAILED
+
+
+def start_profiling():
+    """Profile mutmut itself in this process, until :func:`stop_profiling`."""
+    global _profiler
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+
+
+def stop_profiling(name):
+    """Stop profiling and write the stats to ``PROFILE_DIR/<name>-<pid>.pstats``."""
+    global _profiler
+    if _profiler is None:
+        return
+    _profiler.disable()
+    _profiler.dump_stats(os.path.join(PROFILE_DIR, '{}-{}.pstats'.format(name, os.getpid())))
+    _profiler = None
+
+
+@contextmanager
+def profiling_paused():
+    if _profiler is None:
+        yield
+        return
+    _profiler.disable()
+    try:
+        yield
+    finally:
+        _profiler.enable()
+
+
+def clear_profiles():
+    if isdir(PROFILE_DIR):
+        for entry in os.listdir(PROFILE_DIR):
+            if entry.endswith('.pstats'):
+                os.remove(os.path.join(PROFILE_DIR, entry))
+
+
+def print_profile_summary(limit=30):
+    """Print the stats of all processes in :data:`PROFILE_DIR` merged
+    together, sorted by the time spent in each function itself."""
+    paths = sorted(
+        os.path.join(PROFILE_DIR, entry)
+        for entry in os.listdir(PROFILE_DIR)
+        if entry.endswith('.pstats')
+    ) if isdir(PROFILE_DIR) else []
+    if not paths:
+        print('No profiles in {}'.format(PROFILE_DIR))
+        return
+
+    print('Profile of mutmut merged from {} processes, the per process stats are in {}:'.format(len(paths), PROFILE_DIR))
+    stats = pstats.Stats(*paths)
+    stats.sort_stats('tottime').print_stats(limit)
+
+
+class CoverageIndex(object):
+    """The covered lines of each file, stored as a bitset per file in an
+    sqlite file. The lines of a file are only read when they are asked for,
+    and pickling an index only pickles its path.
     """
-    :rtype: CoverageData or None
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+
+    @classmethod
+    def write(cls, path, lines_by_filename):
+        """
+        :param lines_by_filename: pairs of absolute filename and its covered lines
+        :type lines_by_filename: collections.abc.Iterable[tuple[str, collections.abc.Iterable[int]]]
+        :rtype: CoverageIndex
+        """
+        if os.path.exists(path):
+            os.remove(path)
+        connection = sqlite3.connect(path)
+        try:
+            connection.execute('CREATE TABLE coverage (filename TEXT PRIMARY KEY, lines BLOB NOT NULL)')
+            connection.executemany(
+                'INSERT INTO coverage VALUES (?, ?)',
+                ((filename, encode_line_bitset(lines)) for filename, lines in lines_by_filename)
+            )
+            connection.commit()
+        finally:
+            connection.close()
+        return cls(path)
+
+    def _execute(self, sql, *args):
+        if self._connection is None:
+            # the queue thread reads it too
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        return self._connection.execute(sql, args)
+
+    def get(self, filename, default=None):
+        """
+        :param filename: absolute filename
+        :rtype: set[int] or None
+        """
+        row = self._execute('SELECT lines FROM coverage WHERE filename = ?', filename).fetchone()
+        if row is None:
+            return default
+        return decode_line_bitset(row[0])
+
+    def lines_of(self, filename):
+        """A line filter, see :func:`covered_lines`."""
+        return self.get(os.path.abspath(filename))
+
+    def __iter__(self):
+        return (filename for filename, in self._execute('SELECT filename FROM coverage'))
+
+    def __len__(self):
+        return self._execute('SELECT count(*) FROM coverage').fetchone()[0]
+
+    def __getstate__(self):
+        return dict(path=self.path)
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+
+def encode_line_bitset(lines):
+    bits = 0
+    for line in lines:
+        bits |= 1 << line
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def decode_line_bitset(data):
+    bits = int.from_bytes(data, 'little')
+    return {line for line in range(bits.bit_length()) if bits >> line & 1}
+
+
+def read_coverage_data():
+    """Index the ``.coverage`` file of coverage.py.
+
+    :rtype: CoverageIndex
     """
     try:
         # noinspection PyPackageRequirements,PyUnresolvedReferences
@@ -1165,7 +2335,29 @@ def read_coverage_data():
     cov = Coverage('.coverage')
     cov.load()
     data = cov.get_data()
-    return {filepath: data.lines(filepath) for filepath in data.measured_files()}
+    return CoverageIndex.write(COVERAGE_INDEX_PATH, ((filepath, data.lines(filepath) or ()) for filepath in data.measured_files()))
+
+
+def collect_coverage_data(test_command, callback, using_testmon=False):
+    """Run ``test_command`` with :mod:`mutmut.linetracer` in every Python
+    process, and index the lines that ran, like :func:`read_coverage_data`.
+    The paths are the real ones, so they always match the files to mutate.
+
+    :rtype: CoverageIndex
+    """
+    with TemporaryDirectory() as tracer_dir:
+        copy(linetracer.__file__, os.path.join(tracer_dir, 'sitecustomize.py'))
+        output_dir = os.path.join(tracer_dir, 'output')
+        os.mkdir(output_dir)
+        with environment(**{
+            'PYTHONPATH': os.pathsep.join(x for x in [tracer_dir, os.environ.get('PYTHONPATH')] if x),
+            linetracer.OUTPUT_ENV: output_dir,
+            linetracer.ROOT_ENV: os.getcwd(),
+        }):
+            returncode = popen_streaming_output(test_command, callback)
+        if not (returncode == 0 or (using_testmon and returncode == 5)):
+            raise RuntimeError("Tests don't run cleanly when collecting coverage. Test command was: {}".format(test_command))
+        return CoverageIndex.write(COVERAGE_INDEX_PATH, linetracer.read(output_dir).items())
 
 
 def read_patch_data(patch_file_path):
@@ -1183,12 +2375,113 @@ def read_patch_data(patch_file_path):
     }
 
 
+def git_recent_commits(count):
+    """
+    :return: the hashes of the last ``count`` commits, and the one ``git blame``
+        uses for uncommitted changes
+    :rtype: set[str]
+    """
+    try:
+        output = subprocess.check_output(['git', 'rev-list', '--max-count={}'.format(count), 'HEAD'], stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise RuntimeError('--use-git-recency needs git and a git repository with at least one commit') from e
+    return set(output.decode().split()) | {'0' * 40}
+
+
+def recently_changed_lines(recent_commits, filename):
+    """A line filter, see :func:`covered_lines`, for the lines that
+    ``git blame`` attributes to one of ``recent_commits``.
+
+    :type recent_commits: set[str]
+    :rtype: set[int]
+    """
+    process = subprocess.run(['git', 'blame', '--porcelain', '--', filename], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if process.returncode != 0:
+        # not known to git yet, so all of it is new
+        with open(filename) as f:
+            return set(range(1, len(f.read().splitlines()) + 1))
+
+    result = set()
+    for line in process.stdout.decode(errors='replace').splitlines():
+        match = git_blame_header_re.match(line)
+        if match and match.group(1) in recent_commits:
+            result.add(int(match.group(2)))
+    return result
+
+
+# <commit> <line in the commit> <line in the file> [<lines in the group>]
+git_blame_header_re = re.compile(r'^([0-9a-f]{40}) \d+ (\d+)')
+
+
+def parse_target_selector(argument):
+    """Parse a ``mutmut run`` argument that selects a part of the code:
+    ``path.py::Class.method`` for functions and classes by their qualified
+    name, which may be a glob pattern, or ``path.py:120-180`` and
+    ``path.py:120`` for lines. The path may be a glob pattern too.
+
+    :return: the path pattern and a line filter (see :func:`covered_lines`),
+        or :obj:`None` if ``argument`` is not a selector
+    :rtype: tuple[str, collections.abc.Callable] or None
+    """
+    path, separator, name_pattern = argument.partition('::')
+    if separator:
+        return path, partial(qualified_name_lines, name_pattern)
+    match = line_range_selector_re.match(argument)
+    if match:
+        first = int(match.group('first'))
+        last = int(match.group('last') or first)
+        return match.group('path'), partial(line_range_lines, first, last)
+    return None
+
+
+line_range_selector_re = re.compile(r'^(?P<path>.+):(?P<first>\d+)(?:-(?P<last>\d+))?$')
+
+
+def line_range_lines(first, last, filename):
+    return set(range(first, last + 1))
+
+
+def qualified_name_lines(pattern, filename):
+    """A line filter for the functions and classes in ``filename`` whose
+    qualified name, like ``Class.method``, matches the glob ``pattern``.
+
+    :rtype: set[int]
+    """
+    with open(filename) as f:
+        source = f.read()
+    result = set()
+
+    def visit(node, prefix):
+        for child in getattr(node, 'children', ()):
+            if child.type not in ('funcdef', 'classdef'):
+                visit(child, prefix)
+                continue
+            qualified_name = prefix + child.name.value
+            if fnmatch.fnmatchcase(qualified_name, pattern):
+                first = child
+                # async def is wrapped in an async_funcdef or async_stmt
+                if first.parent.type in ('async_funcdef', 'async_stmt'):
+                    first = first.parent
+                if first.parent.type == 'decorated':
+                    first = first.parent
+                result.update(range(first.start_pos[0], child.get_last_leaf().start_pos[0] + 1))
+            else:
+                visit(child, qualified_name + '.')
+
+    visit(parse(source), '')
+    return result
+
+
 def add_mutations_by_file(mutations_by_file, filename, dict_synonyms, config):
     """
     :type mutations_by_file: dict[str, list[RelativeMutationID]]
     :type filename: str
     :type dict_synonyms: list[str]
     """
+    if config is not None and config.covered_lines_by_filename is not None and covered_lines(config, filename) is None:
+        # the line filters exclude the whole file, so don't even parse it
+        return
+
     with open(filename) as f:
         source = f.read()
     context = Context(
@@ -1238,7 +2531,67 @@ def python_source_files(path, tests_dirs, paths_to_exclude=None):
         yield path
 
 
-def compute_exit_code(progress, exception=None):
+def sample_mutations(mutations_by_file, count, seed):
+    """Draw a random sample of ``count`` mutants, stratified by file and
+    kind of mutation: every group of mutants gets its share of the sample,
+    so a few big files or a common kind of mutation can't crowd out the rest.
+
+    :type mutations_by_file: dict[str, list[RelativeMutationID]]
+    :return: the sampled mutants, in the same order as ``mutations_by_file``
+    :rtype: dict[str, list[RelativeMutationID]]
+    """
+    strata = {}
+    for filename, mutations in mutations_by_file.items():
+        for mutation_id in mutations:
+            strata.setdefault((filename, mutation_id.operator), []).append(mutation_id)
+    total = sum(len(mutations) for mutations in strata.values())
+    count = min(count, total)
+
+    # largest remainder method, so the shares add up to exactly count
+    shares = {key: len(mutations) * count / total for key, mutations in strata.items()}
+    allocation = {key: int(share) for key, share in shares.items()}
+    by_remainder = sorted(strata, key=lambda key: allocation[key] - shares[key])
+    for key in by_remainder[:count - sum(allocation.values())]:
+        allocation[key] += 1
+
+    rng = random.Random(seed)
+    # the mutation ids of different files can be equal
+    sampled = set()
+    for key, mutations in strata.items():
+        filename = key[0]
+        sampled.update((filename, mutation_id) for mutation_id in rng.sample(mutations, allocation[key]))
+    return {
+        filename: [mutation_id for mutation_id in mutations if (filename, mutation_id) in sampled]
+        for filename, mutations in mutations_by_file.items()
+    }
+
+
+def estimate_mutation_score(progress, population):
+    """Estimate the mutation score of all ``population`` mutants from a
+    sample, with a 95% Wilson score interval corrected for the size of the
+    population. Killed and suspicious mutants count as killed, skipped
+    mutants don't count at all.
+
+    :type progress: Progress
+    :return: the estimated score and the lower and upper bound of the interval, or :obj:`None` if no mutants were tested
+    :rtype: tuple[float, float, float] or None
+    """
+    killed = progress.killed_mutants + progress.suspicious_mutants
+    tested = killed + progress.surviving_mutants + progress.surviving_mutants_timeout
+    if not tested:
+        return None
+    score = killed / tested
+    if tested >= population:
+        return score, score, score
+    # the finite population correction shrinks the variance, which is the same as a bigger sample
+    n = tested * (population - 1) / (population - tested)
+    z = 1.959963984540054
+    center = (score + z * z / (2 * n)) / (1 + z * z / n)
+    margin = z / (1 + z * z / n) * sqrt(score * (1 - score) / n + z * z / (4 * n * n))
+    return score, max(0.0, center - margin), min(1.0, center + margin)
+
+
+def compute_exit_code(progress, exception=None, verdict=None):
     """Compute an exit code for mutmut mutation testing
 
     The following exit codes are available for mutmut:
@@ -1251,10 +2604,15 @@ def compute_exit_code(progress, exception=None):
      Exit codes 1 to 8 will be bit-ORed so that it is possible to know what
      different mutant statuses occurred during mutation testing.
 
+     With a ``verdict`` on the mutation score, the exit code is 2 if it
+     failed and 0 if it passed, ORed with 1 for a fatal error.
+
     :param exception:
     :type exception: Exception
     :param progress:
     :type progress: Progress
+    :param verdict: the verdict of a :class:`SequentialTest`
+    :type verdict: str or None
 
     :return: integer noting the exit code of the mutation tests.
     :rtype: int
@@ -1262,6 +2620,9 @@ def compute_exit_code(progress, exception=None):
     code = 0
     if exception is not None:
         code = code | 1
+    if verdict is not None:
+        # only the verdict on the mutation score counts
+        return code | 2 if verdict == SequentialTest.FAILED else code
     if progress.surviving_mutants > 0:
         code = code | 2
     if progress.surviving_mutants_timeout > 0:
@@ -1272,6 +2633,15 @@ def compute_exit_code(progress, exception=None):
 
 
 hammett_prefix = 'python -m hammett '
+JOURNAL_DIR = '.mutmut-journal'
+PROFILE_DIR = '.mutmut-profile'
+COVERAGE_INDEX_PATH = '.mutmut-coverage'
+OUTPUT_TAIL_LINES = 100
+PYTEST_PLUGIN_MODULE = 'mutmut_pytest_plugin'
+PROGRESS_INTERVAL = 0.1
+# how long to wait for more buffered output of a test command that is done
+FINISH_READ_TIMEOUT = 0.05
+_profiler = None
 spinner = itertools.cycle('⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏')
 print_status = status_printer()
 
@@ -1,14 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import json
 import os
+import random
 import sys
 import traceback
+from contextlib import nullcontext
+from fnmatch import fnmatch
+from functools import partial
 from io import (
     open,
 )
 from os.path import exists
 from shutil import copy
+from statistics import median
+from tempfile import TemporaryDirectory
 from time import time
 
 import click
@@ -33,12 +40,39 @@ from mutmut import (
     compute_exit_code,
     print_status,
     close_active_queues,
+    recover_from_journal,
+    check_collected_coverage,
+    collect_coverage_data,
+    git_recent_commits,
+    parse_target_selector,
+    sample_mutations,
+    estimate_mutation_score,
+    SequentialTest,
+    recently_changed_lines,
+    hammett_prefix,
+    pytest_plugin_environment,
+    pytestplugin,
+    ResourceLimitExceeded,
+    Tracer,
+    clear_profiles,
+    start_profiling,
+    stop_profiling,
+    print_profile_summary,
 )
 from mutmut.cache import (
     create_html_report,
     cached_hash_of_tests,
+    export_cache,
+    import_cache,
+    garbage_collect_cache,
+    orphan_ratio,
+    export_results,
+    print_stats,
+    mutant_test_details_from_pk,
+    cached_test_durations,
+    set_cached_test_durations,
 )
-from mutmut.cache import print_result_cache, \
+from mutmut.cache import print_result_cache, print_result_summary, \
     hash_of_tests, \
     filename_and_mutation_id_from_pk, cached_test_time, set_cached_test_time, \
     update_line_numbers, print_result_cache_junitxml, get_unified_diff
@@ -100,6 +134,25 @@ DEFAULT_RUNNER = 'python -m pytest -x --assert=plain'
 @click.option('--untested-policy', type=click.Choice(['ignore', 'skipped', 'error', 'failure']), default='ignore')
 @click.option('--pre-mutation')
 @click.option('--post-mutation')
+@click.option('--cache-gc-threshold', type=float, help='Run `mutmut cache gc` before a run when more than this share of the cache belongs to deleted files')
+@click.option('--summary', is_flag=True, default=False, help='Only print the number of mutants per status for `mutmut results`')
+@click.option('--format', 'export_format', type=click.Choice(['ndjson', 'json']), default='ndjson', help='Output format of `mutmut export`')
+@click.option('--since', help='Only export mutants changed after this unix time, or "last" for changes since the previous export')
+@click.option('--status-file', help='Keep this JSON file updated with throughput, ETA and the mutant each worker is testing during `mutmut run`')
+@click.option('--trace', help='Write a timeline of `mutmut run` to this file in the Chrome trace event format (open it in chrome://tracing or ui.perfetto.dev)')
+@click.option('--profile-mutmut', is_flag=True, default=False, help='Profile mutmut itself (not the tests) during `mutmut run` and print a summary at the end')
+@click.option('--memory-limit', type=int, help='Limit the address space of the test command to this many MB, mutants that hit it count as killed')
+@click.option('--cpu-limit', type=int, help='Limit the test command to this many seconds of CPU time, mutants that hit it count as killed')
+@click.option('--process-limit', type=int, help='Limit the number of processes of the user while the tests run, mutants that hit it count as killed')
+@click.option('--baseline-runs', type=int, help='Run the tests this many times for the baseline and use the median time, default 1')
+@click.option('--collect-coverage', is_flag=True, default=False, help='Run the tests once with a line tracer and only mutate the lines they run, like --use-coverage without a .coverage file')
+@click.option('--sample', help='Only test a random sample of this share of the mutants, like 5%, and estimate the mutation score')
+@click.option('--sample-count', type=int, help='Only test a random sample of this many mutants and estimate the mutation score')
+@click.option('--sample-seed', type=int, help='Seed for --sample and --sample-count, to draw the same sample again, and for the order of the mutants with --fail-under and --pass-over')
+@click.option('--fail-under', type=float, help='Fail if the mutation score is under this percentage. Mutants are tested in a random order until the verdict is certain')
+@click.option('--pass-over', type=float, help='Pass if the mutation score is over this percentage, default 5 points over --fail-under')
+@click.option('--verdict-confidence', type=float, help='The chance that the verdict of --fail-under and --pass-over is right, default 0.95')
+@click.option('--use-git-recency', type=int, help='Only mutate lines that git blame attributes to the last N commits or to uncommitted changes')
 @config_from_setup_cfg(
     dict_synonyms='',
     paths_to_exclude='',
@@ -113,11 +166,17 @@ def climain(command, argument, argument2, paths_to_mutate, backup, runner, tests
             test_time_multiplier, test_time_base,
             swallow_output, use_coverage, dict_synonyms, cache_only, version,
             suspicious_policy, untested_policy, pre_mutation, post_mutation,
-            use_patch_file, paths_to_exclude):
+            use_patch_file, paths_to_exclude, cache_gc_threshold, summary,
+            export_format, since, status_file, trace, profile_mutmut,
+            memory_limit, cpu_limit, process_limit, baseline_runs,
+            collect_coverage, use_git_recency, sample, sample_count,
+            sample_seed, fail_under, pass_over, verdict_confidence):
     """
 commands:\n
     run [mutation id]\n
         Runs mutmut. You probably want to start with just trying this. If you supply a mutation ID mutmut will check just this mutant.\n
+    run [path to file | path.py::Class.method | path.py:120-180]\n
+        Only check the mutants in this file, in these functions or classes, or on these lines. Paths and names may be glob patterns.\n
     results\n
         Print the results.\n
     apply [mutation id]\n
@@ -127,7 +186,17 @@ commands:\n
     show [path to file]\n
         Show all mutation diffs for this file.\n
     junitxml\n
-        Show a mutation diff with junitxml format.
+        Show a mutation diff with junitxml format.\n
+    export\n
+        Print all mutants with their status, timing and diff as JSON (see --format and --since).\n
+    stats\n
+        Show where the time of the mutation testing went.\n
+    cache export [path]\n
+        Write the results in the cache to a portable archive.\n
+    cache import [path]\n
+        Merge the results from an archive written by `cache export` into the cache.\n
+    cache gc\n
+        Remove results for deleted code from the cache and compact it.
     """
     if test_time_base is None:  # click sets the default=0.0 to None
         test_time_base = 0.0
@@ -137,14 +206,25 @@ commands:\n
                   tests_dir, test_time_multiplier, test_time_base,
                   swallow_output, use_coverage, dict_synonyms, cache_only,
                   version, suspicious_policy, untested_policy, pre_mutation,
-                  post_mutation, use_patch_file, paths_to_exclude))
+                  post_mutation, use_patch_file, paths_to_exclude,
+                  cache_gc_threshold, summary, export_format, since,
+                  status_file, trace, profile_mutmut, memory_limit, cpu_limit,
+                  process_limit, baseline_runs, collect_coverage,
+                  use_git_recency, sample, sample_count, sample_seed,
+                  fail_under, pass_over, verdict_confidence))
 
 
 def main(command, argument, argument2, paths_to_mutate, backup, runner, tests_dir,
          test_time_multiplier, test_time_base,
          swallow_output, use_coverage, dict_synonyms, cache_only, version,
          suspicious_policy, untested_policy, pre_mutation, post_mutation,
-         use_patch_file, paths_to_exclude):
+         use_patch_file, paths_to_exclude, cache_gc_threshold=None, summary=False,
+         export_format='ndjson', since=None, status_file=None, trace=None,
+         profile_mutmut=False, memory_limit=None, cpu_limit=None,
+         process_limit=None, baseline_runs=None, collect_coverage=False,
+         use_git_recency=None, sample=None, sample_count=None,
+         sample_seed=None, fail_under=None, pass_over=None,
+         verdict_confidence=None):
     """return exit code, after performing an mutation test run.
 
     :return: the exit code from executing the mutation tests
@@ -154,10 +234,22 @@ def main(command, argument, argument2, paths_to_mutate, backup, runner, tests_di
         print("mutmut version {}".format(__version__))
         return 0
 
-    if use_coverage and use_patch_file:
-        raise click.BadArgumentUsage("You can't combine --use-coverage and --use-patch")
+    if collect_coverage and use_coverage:
+        raise click.BadArgumentUsage("You can't combine --collect-coverage and --use-coverage")
 
-    valid_commands = ['run', 'results', 'apply', 'show', 'junitxml', 'html']
+    if sample and sample_count:
+        raise click.BadArgumentUsage("You can't combine --sample and --sample-count")
+
+    sequential_test = None
+    if fail_under or pass_over:
+        fail_under = float(fail_under) if fail_under else float(pass_over) - 5
+        pass_over = float(pass_over) if pass_over else fail_under + 5
+        try:
+            sequential_test = SequentialTest(fail_under / 100, pass_over / 100, float(verdict_confidence or 0.95))
+        except ValueError as e:
+            raise click.BadArgumentUsage('--fail-under and --pass-over: {}'.format(e))
+
+    valid_commands = ['run', 'results', 'apply', 'show', 'junitxml', 'html', 'cache', 'export', 'stats']
     if command not in valid_commands:
         raise click.BadArgumentUsage('{} is not a valid command, must be one of {}'.format(command, ', '.join(valid_commands)))
 
@@ -166,6 +258,9 @@ def main(command, argument, argument2, paths_to_mutate, backup, runner, tests_di
 
     dict_synonyms = [x.strip() for x in dict_synonyms.split(',')]
 
+    for filename in recover_from_journal():
+        print('Restored {} which was left mutated by an interrupted mutmut run'.format(filename))
+
     if command in ('show', 'diff'):
         if not argument:
             print_result_cache()
@@ -180,13 +275,36 @@ def main(command, argument, argument2, paths_to_mutate, backup, runner, tests_di
             return 0
 
         print(get_unified_diff(argument, dict_synonyms))
+        details = mutant_test_details_from_pk(argument)
+        if details['limit_reason'] == 'killed':
+            print('Killed by a SIGKILL')
+        elif details['limit_reason']:
+            print('Killed by the {}'.format(details['limit_reason']))
+        if details['output']:
+            print('Tail of the test output:')
+            print(details['output'])
+        return 0
+
+    if command == 'cache':
+        if argument == 'gc':
+            garbage_collect_cache()
+            return 0
+        if argument not in ('export', 'import') or not argument2:
+            raise click.BadArgumentUsage('The cache command takes "export <path>", "import <path>" or "gc"')
+        if argument == 'export':
+            print('Exported {} results to {}'.format(export_cache(argument2), argument2))
+        else:
+            print('Imported {} new results from {}'.format(import_cache(argument2), argument2))
         return 0
 
     if use_coverage and not exists('.coverage'):
         raise FileNotFoundError('No .coverage file found. You must generate a coverage file to use this feature.')
 
     if command == 'results':
-        print_result_cache()
+        if summary:
+            print_result_summary()
+        else:
+            print_result_cache()
         return 0
 
     if command == 'junitxml':
@@ -197,10 +315,22 @@ def main(command, argument, argument2, paths_to_mutate, backup, runner, tests_di
         create_html_report(dict_synonyms)
         return 0
 
+    if command == 'stats':
+        print_stats()
+        return 0
+
+    if command == 'export':
+        export_results(export_format or 'ndjson', dict_synonyms, since=since)
+        return 0
+
     if command == 'apply':
         do_apply(argument, dict_synonyms, backup)
         return 0
 
+    if cache_gc_threshold and exists('.mutmut-cache') and orphan_ratio() > float(cache_gc_threshold):
+        print('Cleaning up the mutmut cache...')
+        garbage_collect_cache()
+
     if paths_to_mutate is None:
         paths_to_mutate = guess_paths_to_mutate()
 
@@ -249,12 +379,31 @@ Legend for output:
         except ImportError:
             runner = 'python -m unittest'
 
-    baseline_time_elapsed = time_test_suite(
-        swallow_output=not swallow_output,
-        test_command=runner,
-        using_testmon=using_testmon,
-        current_hash_of_tests=current_hash_of_tests,
-    )
+    if profile_mutmut:
+        clear_profiles()
+        start_profiling()
+
+    tracer = Tracer(trace) if trace else None
+
+    resource_limits = {}
+    if memory_limit:
+        resource_limits['address_space'] = int(memory_limit) * 1024 * 1024
+    if cpu_limit:
+        resource_limits['cpu'] = int(cpu_limit)
+    if process_limit:
+        resource_limits['processes'] = int(process_limit)
+    if resource_limits and runner.startswith(hammett_prefix):
+        print('Note: hammett runs the tests of the mutants inside mutmut, so the resource limits only apply to the baseline')
+
+    with tracer.span('baseline', 'baseline') if tracer else nullcontext():
+        baseline_time_elapsed = time_test_suite(
+            swallow_output=not swallow_output,
+            test_command=runner,
+            using_testmon=using_testmon,
+            current_hash_of_tests=current_hash_of_tests,
+            resource_limits=resource_limits or None,
+            baseline_runs=int(baseline_runs or 1),
+        )
 
     if hasattr(mutmut_config, 'init'):
         mutmut_config.init()
@@ -262,17 +411,24 @@ Legend for output:
     if using_testmon:
         copy('.testmondata', '.testmondata-initial')
 
-    # if we're running in a mode with externally whitelisted lines
-    covered_lines_by_filename = None
-    coverage_data = None
-    if use_coverage or use_patch_file:
-        covered_lines_by_filename = {}
-        if use_coverage:
-            coverage_data = read_coverage_data()
-            check_coverage_data_filepaths(coverage_data)
-        else:
-            assert use_patch_file
-            covered_lines_by_filename = read_patch_data(use_patch_file)
+    # if we're running in a mode with externally whitelisted lines, only
+    # mutate the lines that all of them let through
+    line_filters = []
+    if use_coverage:
+        coverage_data = read_coverage_data()
+        check_coverage_data_filepaths(coverage_data)
+        line_filters.append(coverage_data.lines_of)
+    if collect_coverage:
+        print('Collecting coverage...', end='', flush=True)
+        coverage_data = collect_coverage_data(runner, lambda line: print_status('Collecting coverage...'), using_testmon=using_testmon)
+        print('Done')
+        check_collected_coverage(coverage_data, paths_to_mutate)
+        line_filters.append(coverage_data.lines_of)
+    if use_patch_file:
+        line_filters.append(read_patch_data(use_patch_file).get)
+    if use_git_recency:
+        line_filters.append(partial(recently_changed_lines, git_recent_commits(int(use_git_recency))))
+    covered_lines_by_filename = {} if line_filters else None
 
     if command != 'run':
         raise click.BadArgumentUsage("Invalid command {}".format(command))
@@ -288,7 +444,7 @@ Legend for output:
         swallow_output=not swallow_output,
         test_command=runner,
         covered_lines_by_filename=covered_lines_by_filename,
-        coverage_data=coverage_data,
+        line_filters=line_filters,
         baseline_time_elapsed=baseline_time_elapsed,
         backup=backup,
         dict_synonyms=dict_synonyms,
@@ -301,27 +457,102 @@ Legend for output:
         pre_mutation=pre_mutation,
         post_mutation=post_mutation,
         paths_to_mutate=paths_to_mutate,
+        resource_limits=resource_limits or None,
     )
 
-    parse_run_argument(argument, config, dict_synonyms, mutations_by_file, paths_to_exclude, paths_to_mutate, tests_dirs)
+    with tracer.span('discovery', 'discovery') if tracer else nullcontext():
+        parse_run_argument(argument, config, dict_synonyms, mutations_by_file, paths_to_exclude, paths_to_mutate, tests_dirs)
 
     config.total = sum(len(mutations) for mutations in mutations_by_file.values())
 
+    if sample_seed is None or sample_seed == '':
+        sample_seed = random.randrange(2 ** 32)
+    sample_seed = int(sample_seed)
+
+    population = None
+    if sample or sample_count:
+        population = config.total
+        count = parse_sample_size(sample, population) if sample else int(sample_count)
+        mutations_by_file = sample_mutations(mutations_by_file, count, sample_seed)
+        config.total = sum(len(mutations) for mutations in mutations_by_file.values())
+        print('Sampled {} of {} mutants, use --sample-seed={} to test the same ones again'.format(config.total, population, sample_seed))
+
     print()
     print('2. Checking mutants')
     progress = Progress(total=config.total)
 
     try:
-        run_mutation_tests(config=config, progress=progress, mutations_by_file=mutations_by_file)
+        with TemporaryDirectory() as time_limits_dir:
+            # kill the tests of a mutant as soon as one test takes 10 times
+            # as long as in the baseline
+            test_durations = cached_test_durations()
+            time_limits_filename = os.path.join(time_limits_dir, 'time_limits.json')
+            pytestplugin.write_time_limits(time_limits_filename, test_durations, multiplier=10, minimum=1.0)
+            with pytest_plugin_environment(runner, **{pytestplugin.TIME_LIMITS_ENV: time_limits_filename}) if test_durations else nullcontext():
+                run_mutation_tests(
+                    config=config, progress=progress, mutations_by_file=mutations_by_file, status_file=status_file, tracer=tracer, profile=profile_mutmut,
+                    sequential_test=sequential_test, shuffle_seed=sample_seed if sequential_test else None,
+                )
+        if population is not None:
+            print_estimated_mutation_score(progress, population)
     except Exception as e:
         traceback.print_exc()
         return compute_exit_code(progress, e)
     else:
-        return compute_exit_code(progress)
+        verdict = None
+        if sequential_test is not None:
+            verdict = sequential_test.final_verdict(progress)
+            print_verdict(sequential_test, verdict, progress)
+        return compute_exit_code(progress, verdict=verdict)
     finally:
         print()  # make sure we end the output with a newline
         # Close all active multiprocessing queues to avoid hanging up the main process
         close_active_queues()
+        if tracer is not None:
+            tracer.write()
+        if profile_mutmut:
+            stop_profiling('main')
+            print_profile_summary()
+
+
+def parse_sample_size(sample, total):
+    """
+    :param sample: a share of the mutants like ``5%`` or ``0.05``
+    :return: the number of mutants to sample, at least one
+    :rtype: int
+    """
+    try:
+        if sample.endswith('%'):
+            share = float(sample[:-1]) / 100
+        else:
+            share = float(sample)
+    except ValueError:
+        raise click.BadArgumentUsage('--sample takes a share of the mutants like 5% or 0.05')
+    if not 0 < share <= 1:
+        raise click.BadArgumentUsage('--sample takes a share of the mutants like 5% or 0.05')
+    return max(1, round(total * share))
+
+
+def print_estimated_mutation_score(progress, population):
+    estimate = estimate_mutation_score(progress, population)
+    print()
+    if estimate is None:
+        print('No sampled mutants were tested, so there is no estimate of the mutation score')
+        return
+    score, low, high = estimate
+    print('Estimated mutation score: {:.1%} (95% confidence interval {:.1%} to {:.1%}) from {} of {} mutants'.format(score, low, high, progress.progress, population))
+
+
+def print_verdict(sequential_test, verdict, progress):
+    print()
+    if progress.progress < progress.total:
+        print('Stopped after {} of {} mutants, the rest are untested'.format(progress.progress, progress.total))
+    if sequential_test.verdict(progress) is None:
+        print('The mutation score is too close to call, so it {} by comparing it with {:.1%}'.format(verdict, (sequential_test.fail_under + sequential_test.pass_over) / 2))
+    elif verdict == SequentialTest.PASSED:
+        print('The mutation score is over {:.1%}'.format(sequential_test.pass_over))
+    else:
+        print('The mutation score is under {:.1%}'.format(sequential_test.fail_under))
 
 
 def parse_run_argument(argument, config, dict_synonyms, mutations_by_file, paths_to_exclude, paths_to_mutate, tests_dirs):
@@ -336,11 +567,28 @@ def parse_run_argument(argument, config, dict_synonyms, mutations_by_file, paths
         try:
             int(argument)
         except ValueError:
-            filename = argument
-            if not os.path.exists(filename):
-                raise click.BadArgumentUsage('The run command takes either an integer that is the mutation id or a path to a file to mutate')
-            update_line_numbers(filename)
-            add_mutations_by_file(mutations_by_file, filename, dict_synonyms, config)
+            selector = parse_target_selector(argument)
+            if selector is None:
+                filenames = [argument]
+            else:
+                path_pattern, line_filter = selector
+                if config.covered_lines_by_filename is None:
+                    config.covered_lines_by_filename = {}
+                config.line_filters.append(line_filter)
+                if os.path.exists(path_pattern):
+                    filenames = [path_pattern]
+                else:
+                    filenames = [
+                        filename
+                        for path in paths_to_mutate
+                        for filename in python_source_files(path, tests_dirs, paths_to_exclude)
+                        if fnmatch(filename, path_pattern)
+                    ]
+            if not filenames or not all(os.path.exists(filename) for filename in filenames):
+                raise click.BadArgumentUsage('The run command takes either an integer that is the mutation id, a path to a file to mutate or a selector like path.py::Class.method or path.py:120-180')
+            for filename in filenames:
+                update_line_numbers(filename)
+                add_mutations_by_file(mutations_by_file, filename, dict_synonyms, config)
             return
 
         filename, mutation_id = filename_and_mutation_id_from_pk(int(argument))
@@ -348,7 +596,7 @@ def parse_run_argument(argument, config, dict_synonyms, mutations_by_file, paths
         mutations_by_file[filename] = [mutation_id]
 
 
-def time_test_suite(swallow_output, test_command, using_testmon, current_hash_of_tests):
+def time_test_suite(swallow_output, test_command, using_testmon, current_hash_of_tests, resource_limits=None, baseline_runs=1):
     """Execute a test suite specified by ``test_command`` and record
     the time it took to execute the test suite as a floating point number
 
@@ -362,6 +610,14 @@ def time_test_suite(swallow_output, test_command, using_testmon, current_hash_of
         accommodate for ``pytest-testmon``
     :type using_testmon: bool
 
+    :param resource_limits: limits for the test command, see
+        :func:`mutmut.set_resource_limits`
+    :type resource_limits: dict[str, int]
+
+    :param baseline_runs: run the test suite this many times and use the
+        median time
+    :type baseline_runs: int
+
     :return: execution time of the test suite
     :rtype: float
     """
@@ -371,7 +627,6 @@ def time_test_suite(swallow_output, test_command, using_testmon, current_hash_of
         return cached_time
 
     print('1. Running tests without mutations')
-    start_time = time()
 
     output = []
 
@@ -381,16 +636,42 @@ def time_test_suite(swallow_output, test_command, using_testmon, current_hash_of
         print_status('Running...')
         output.append(line)
 
-    returncode = popen_streaming_output(test_command, feedback)
-
-    if returncode == 0 or (using_testmon and returncode == 5):
-        baseline_time_elapsed = time() - start_time
+    timings = []
+    with TemporaryDirectory() as durations_dir:
+        # if the tests run with pytest, record how long each test takes
+        durations_filename = os.path.join(durations_dir, 'durations.json')
+        with pytest_plugin_environment(test_command, **{pytestplugin.DURATIONS_OUTPUT_ENV: durations_filename}):
+            for _ in range(max(baseline_runs, 1)):
+                output.clear()
+                start_time = time()
+                try:
+                    returncode = popen_streaming_output(
+                        test_command, feedback, resource_limits=resource_limits,
+                        passing_returncodes=(0, 5) if using_testmon else (0,),
+                    )
+                except ResourceLimitExceeded as e:
+                    raise RuntimeError("Tests don't run within the resource limits without mutations, {}. Test command was: {}".format(e, test_command))
+
+                if not (returncode == 0 or (using_testmon and returncode == 5)):
+                    raise RuntimeError("Tests don't run cleanly without mutations. Test command was: {}\n\nOutput:\n\n{}".format(test_command, '\n'.join(output)))
+                timings.append(time() - start_time)
+
+        test_durations = {}
+        if os.path.exists(durations_filename):
+            with open(durations_filename) as f:
+                test_durations = json.load(f)
+
+    baseline_time_elapsed = median(timings)
+    # median absolute deviation, robust against a single slow run
+    dispersion = median(abs(x - baseline_time_elapsed) for x in timings)
+
+    if len(timings) > 1:
+        print('Done, median of {} runs: {:.3f}s ± {:.3f}s'.format(len(timings), baseline_time_elapsed, dispersion))
     else:
-        raise RuntimeError("Tests don't run cleanly without mutations. Test command was: {}\n\nOutput:\n\n{}".format(test_command, '\n'.join(output)))
-
-    print('Done')
+        print('Done')
 
-    set_cached_test_time(baseline_time_elapsed, current_hash_of_tests)
+    set_cached_test_time(baseline_time_elapsed, current_hash_of_tests, dispersion)
+    set_cached_test_durations(test_durations)
 
     return baseline_time_elapsed
 
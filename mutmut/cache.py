@@ -1,30 +1,47 @@
 # -*- coding: utf-8 -*-
 
+import gzip
 import hashlib
+import json
+import multiprocessing
 import os
+import sqlite3
+import sys
 from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from difflib import SequenceMatcher, unified_diff
 from functools import wraps
+from html import escape as html_escape
 from io import open
-from itertools import groupby, zip_longest
+from itertools import zip_longest
 from os.path import join, dirname
+from time import time
 from typing import Tuple
+from xml.sax.saxutils import escape
 
-
-from junit_xml import TestSuite, TestCase
+from parso import parse
 from pony.orm import Database, Required, db_session, Set, Optional, select, \
-    PrimaryKey, RowNotFound, ERDiagramError, OperationalError
+    PrimaryKey, OperationalError, delete, count, LongStr
 
 from mutmut import BAD_TIMEOUT, OK_SUSPICIOUS, BAD_SURVIVED, UNTESTED, \
-    OK_KILLED, RelativeMutationID, Context, mutate
+    OK_KILLED, SKIPPED, RelativeMutationID, Context, mutate, __version__
 
 db = Database()
 
-current_db_version = 4
+CACHE_FILENAME = '.mutmut-cache'
+
+current_db_version = 10
 
 
 NO_TESTS_FOUND = 'NO TESTS FOUND'
 
+CACHE_ARCHIVE_FORMAT = 'mutmut-cache-archive-1'
+
+# Timeouts and suspicious mutants depend on the speed of the machine, so only
+# these results are stored by content and shared
+SHARED_STATUSES = (OK_KILLED, BAD_SURVIVED)
+
 
 class MiscData(db.Entity):
     key = PrimaryKey(str, auto=True)
@@ -34,6 +51,7 @@ class MiscData(db.Entity):
 class SourceFile(db.Entity):
     filename = Required(str, autostrip=False)
     hash = Optional(str)
+    report_hash = Optional(str)  # of the source and statuses the html report page was made from
     lines = Set('Line')
 
 
@@ -48,14 +66,121 @@ class Mutant(db.Entity):
     line = Required(Line)
     index = Required(int)
     tested_against_hash = Optional(str, autostrip=False)
-    status = Required(str, autostrip=False)  # really an enum of mutant_statuses
+    status = Required(str, autostrip=False, index=True)  # really an enum of mutant_statuses
+    operator = Optional(str, autostrip=False)  # see RelativeMutationID.operator
+    duration = Optional(float)  # of the last test run, in seconds
+    mutate_duration = Optional(float)  # the rest of the time the worker spent on the mutant
+    queue_duration = Optional(float)  # waiting for a worker
+    modified = Optional(float)  # unix time of the last status change
+    output = Optional(LongStr, autostrip=False)  # tail of the test output, for survivors and timeouts
+    limit_reason = Optional(str, autostrip=False)  # the resource limit that killed the mutant, if any
+
+
+class ContentResult(db.Entity):
+    """Test result of a mutant keyed by the content it was tested against,
+    see :func:`content_hash_of_mutant`. Unlike :class:`Mutant` these rows
+    don't depend on the filename or the working directory, so they can be
+    shared between branches and machines with `mutmut cache export/import`.
+    Only the :data:`SHARED_STATUSES` are stored.
+    """
+    key = PrimaryKey(str, autostrip=False)
+    status = Required(str, autostrip=False)
+
+
+# Schema migrations of the cache, keyed on the version they migrate from.
+# Each one gets a sqlite3 cursor and must leave the database in the schema of
+# the next version. Caches older than the oldest migration (versions 1 to 3,
+# or without a version at all) are cleared.
+def _migrate_4_to_5(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS "idx_mutant__status" ON "Mutant" ("status")')
+
+
+def _migrate_5_to_6(cursor):
+    cursor.execute('ALTER TABLE "SourceFile" ADD COLUMN "report_hash" TEXT NOT NULL DEFAULT \'\'')
+
+
+def _migrate_6_to_7(cursor):
+    cursor.execute('ALTER TABLE "Mutant" ADD COLUMN "operator" TEXT NOT NULL DEFAULT \'\'')
+    cursor.execute('ALTER TABLE "Mutant" ADD COLUMN "duration" REAL')
+    cursor.execute('ALTER TABLE "Mutant" ADD COLUMN "modified" REAL')
+
+
+def _migrate_7_to_8(cursor):
+    cursor.execute('ALTER TABLE "Mutant" ADD COLUMN "mutate_duration" REAL')
+    cursor.execute('ALTER TABLE "Mutant" ADD COLUMN "queue_duration" REAL')
+
+
+def _migrate_8_to_9(cursor):
+    cursor.execute('ALTER TABLE "Mutant" ADD COLUMN "output" TEXT NOT NULL DEFAULT \'\'')
+
+
+def _migrate_9_to_10(cursor):
+    cursor.execute('ALTER TABLE "Mutant" ADD COLUMN "limit_reason" TEXT NOT NULL DEFAULT \'\'')
+
+
+migrations = {
+    4: _migrate_4_to_5,
+    5: _migrate_5_to_6,
+    6: _migrate_6_to_7,
+    7: _migrate_7_to_8,
+    8: _migrate_8_to_9,
+    9: _migrate_9_to_10,
+}
+
+
+def migrate_db(cache_filename):
+    """Bring an existing cache file up to :data:`current_db_version`, keeping
+    the results in it if there are migrations for all the versions in between.
+    """
+    # sqlite3 doesn't start a transaction for ALTER TABLE, so they are done by
+    # hand: each step and its version bump happen together or not at all
+    connection = sqlite3.connect(cache_filename, isolation_level=None)
+    try:
+        cursor = connection.cursor()
+        try:
+            row = cursor.execute("SELECT value FROM MiscData WHERE key = 'version'").fetchone()
+            existing_db_version = 1 if row is None else int(row[0])
+        except sqlite3.DatabaseError:
+            existing_db_version = 1
+
+        if existing_db_version == current_db_version:
+            return
+
+        while existing_db_version in migrations and existing_db_version < current_db_version:
+            with _transaction(cursor):
+                migrations[existing_db_version](cursor)
+                cursor.execute("UPDATE MiscData SET value = ? WHERE key = 'version'", (str(existing_db_version + 1),))
+            existing_db_version += 1
+
+        if existing_db_version != current_db_version:
+            print('mutmut cache is out of date, clearing it...')
+            with _transaction(cursor):
+                tables = [x for x, in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name != 'sqlite_sequence'")]
+                for table in tables:
+                    cursor.execute('DROP TABLE "{}"'.format(table))
+    finally:
+        connection.close()
+
+
+@contextmanager
+def _transaction(cursor):
+    cursor.execute('BEGIN')
+    try:
+        yield
+    except BaseException:
+        cursor.execute('ROLLBACK')
+        raise
+    cursor.execute('COMMIT')
 
 
 def init_db(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         if db.provider is None:
-            cache_filename = os.path.join(os.getcwd(), '.mutmut-cache')
+            cache_filename = os.path.join(os.getcwd(), CACHE_FILENAME)
+            if os.path.exists(cache_filename):
+                migrate_db(cache_filename)
+
             db.bind(provider='sqlite', filename=cache_filename, create_db=True)
 
             try:
@@ -63,24 +188,6 @@ def init_db(f):
             except OperationalError:
                 pass
 
-            if os.path.exists(cache_filename):
-                # If the existing cache file is out of data, delete it and start over
-                with db_session:
-                    try:
-                        v = MiscData.get(key='version')
-                        if v is None:
-                            existing_db_version = 1
-                        else:
-                            existing_db_version = int(v.value)
-                    except (RowNotFound, ERDiagramError, OperationalError):
-                        existing_db_version = 1
-
-                if existing_db_version != current_db_version:
-                    print('mutmut cache is out of date, clearing it...')
-                    db.drop_all_tables(with_all_data=True)
-                    db.schema = None  # Pony otherwise thinks we've already created the tables
-                    db.generate_mapping(create_tables=True)
-
             with db_session:
                 v = get_or_create(MiscData, key='version')
                 v.value = str(current_db_version)
@@ -97,12 +204,22 @@ def hash_of(filename):
 
 
 def hash_of_tests(tests_dirs):
+    """Hash of the relative paths and the contents of the files in the tests
+    directories. Caches like ``__pycache__`` are left out and the files are
+    read in sorted order, so the same tests give the same hash everywhere.
+    """
     m = hashlib.sha256()
     found_something = False
     for tests_dir in tests_dirs:
         for root, dirs, files in os.walk(tests_dir):
-            for filename in files:
-                with open(os.path.join(root, filename), 'rb') as f:
+            dirs[:] = sorted(d for d in dirs if d != '__pycache__' and not d.startswith('.'))
+            for filename in sorted(files):
+                if filename.endswith(('.pyc', '.pyo')):
+                    continue
+                path = os.path.join(root, filename)
+                m.update(os.path.relpath(path, tests_dir).replace(os.sep, '/').encode('utf8'))
+                m.update(b'\0')
+                with open(path, 'rb') as f:
                     m.update(f.read())
                     found_something = True
     if not found_something:
@@ -110,6 +227,31 @@ def hash_of_tests(tests_dirs):
     return m.hexdigest()
 
 
+def content_hash_of_mutant(source_hash, mutation_id, hash_of_tests, test_command, dict_synonyms):
+    """Hash of everything that decides the outcome of testing a mutant: the
+    mutated module (given by the hash of the original source and the
+    mutation id on it), the test suite and the command used to run it.
+
+    :rtype: str or None
+    """
+    if not source_hash or hash_of_tests == NO_TESTS_FOUND:
+        return None
+    m = hashlib.sha256()
+    for x in [
+        __version__,
+        source_hash,
+        mutation_id.line,
+        str(mutation_id.line_number),
+        str(mutation_id.index),
+        ','.join(sorted(dict_synonyms or [])),
+        hash_of_tests,
+        test_command,
+    ]:
+        m.update(x.encode('utf8'))
+        m.update(b'\0')
+    return m.hexdigest()
+
+
 def get_apply_line(mutant):
     apply_line = 'mutmut apply {}'.format(mutant.id)
     return apply_line
@@ -153,36 +295,60 @@ def print_result_cache(show_diffs=False, dict_synonyms=None, print_only_filename
     print('    mutmut show <id>')
     print('')
 
-    def print_stuff(title, mutant_query):
-        mutant_list = list(sorted(mutant_query, key=lambda x: x.line.sourcefile.filename))
-        if mutant_list:
-            print('')
-            print("{} ({})".format(title, len(mutant_list)))
-            for filename, mutants in groupby(mutant_list, key=lambda x: x.line.sourcefile.filename):
-                if print_only_filename is not None and print_only_filename != filename:
-                    continue
+    def print_stuff(title, status):
+        count_by_filename = select((x.line.sourcefile.filename, count(x)) for x in Mutant if x.status == status).order_by(1)[:]
+        if not count_by_filename:
+            return
 
-                if only_this_file and filename != only_this_file:
-                    continue
+        print('')
+        print("{} ({})".format(title, sum(c for _, c in count_by_filename)))
+        for filename, c in count_by_filename:
+            if print_only_filename is not None and print_only_filename != filename:
+                continue
 
-                mutants = list(mutants)
-                print('')
-                print("---- {} ({}) ----".format(filename, len(mutants)))
-                print('')
-                if show_diffs:
-                    with open(filename) as f:
-                        source = f.read()
+            if only_this_file and filename != only_this_file:
+                continue
 
-                    for x in mutants:
-                        print('# mutant {}'.format(x.id))
-                        print(get_unified_diff(x.id, dict_synonyms, update_cache=False, source=source))
-                else:
-                    print(ranges([x.id for x in mutants]))
+            print('')
+            print("---- {} ({}) ----".format(filename, c))
+            print('')
+            mutants = select(
+                (x.id, x.line.line, x.index, x.line.line_number)
+                for x in Mutant
+                if x.status == status and x.line.sourcefile.filename == filename
+            ).order_by(1)[:]
+            if show_diffs:
+                with open(filename) as f:
+                    source = f.read()
+
+                ids = [x[0] for x in mutants]
+                mutation_ids = [RelativeMutationID(line=line, index=index, line_number=line_number) for _, line, index, line_number in mutants]
+                for mutant_id, diff in zip(ids, unified_diffs_of_file(filename, source, mutation_ids, dict_synonyms)):
+                    print('# mutant {}'.format(mutant_id))
+                    print(diff)
+            else:
+                print(ranges([x[0] for x in mutants]))
 
-    print_stuff('Timed out ⏰', select(x for x in Mutant if x.status == BAD_TIMEOUT))
-    print_stuff('Suspicious 🤔', select(x for x in Mutant if x.status == OK_SUSPICIOUS))
-    print_stuff('Survived 🙁', select(x for x in Mutant if x.status == BAD_SURVIVED))
-    print_stuff('Untested/skipped', select(x for x in Mutant if x.status == UNTESTED))
+    print_stuff('Timed out ⏰', BAD_TIMEOUT)
+    print_stuff('Suspicious 🤔', OK_SUSPICIOUS)
+    print_stuff('Survived 🙁', BAD_SURVIVED)
+    print_stuff('Untested/skipped', UNTESTED)
+
+
+@init_db
+@db_session
+def print_result_summary():
+    count_by_status = dict(select((x.status, count(x)) for x in Mutant)[:])
+    for title, status in [
+        ('Killed 🎉', OK_KILLED),
+        ('Timed out ⏰', BAD_TIMEOUT),
+        ('Suspicious 🤔', OK_SUSPICIOUS),
+        ('Survived 🙁', BAD_SURVIVED),
+        ('Skipped 🔇', SKIPPED),
+        ('Untested', UNTESTED),
+    ]:
+        print('{}: {}'.format(title, count_by_status.get(status, 0)))
+    print('Total: {}'.format(sum(count_by_status.values())))
 
 
 def get_unified_diff(argument, dict_synonyms, update_cache=True, source=None):
@@ -208,110 +374,213 @@ def _get_unified_diff(source, filename, mutation_id, dict_synonyms, update_cache
         mutation_id=mutation_id,
         dict_synonyms=dict_synonyms,
     )
-    mutated_source, number_of_mutations_performed = mutate(context)
+    return _unified_diff_of_context(context, source)
+
+
+def unified_diffs_of_file(filename, source, mutation_ids, dict_synonyms):
+    """Yield the diff of each of the mutants in ``mutation_ids``, parsing the
+    source only once for all of them.
+    """
+    parsed = None
+    for mutation_id in mutation_ids:
+        context = Context(
+            source=source,
+            filename=filename,
+            mutation_id=mutation_id,
+            dict_synonyms=dict_synonyms,
+        )
+        if parsed is None:
+            parsed = parse(context.source, error_recovery=False)
+        yield _unified_diff_of_context(context, source, parsed=parsed)
+
+
+def _unified_diff_of_context(context, source, parsed=None):
+    mutated_source, number_of_mutations_performed = mutate(context, parsed=parsed)
     if not number_of_mutations_performed:
         return ""
 
     output = ""
-    for line in unified_diff(source.split('\n'), mutated_source.split('\n'), fromfile=filename, tofile=filename, lineterm=''):
+    for line in unified_diff(source.split('\n'), mutated_source.split('\n'), fromfile=context.filename, tofile=context.filename, lineterm=''):
         output += line + "\n"
     return output
 
 
+def _xml_attributes(**attributes):
+    return ' '.join('{}="{}"'.format(k, escape(str(v), {'"': '&quot;'})) for k, v in attributes.items())
+
+
 @init_db
 @db_session
 def print_result_cache_junitxml(dict_synonyms, suspicious_policy, untested_policy):
-    test_cases = []
-    mutant_list = list(select(x for x in Mutant))
-    for filename, mutants in groupby(mutant_list, key=lambda x: x.line.sourcefile.filename):
+    # Which element each status is reported as, None means just a passed test case
+    element_by_status = {
+        BAD_SURVIVED: 'failure',
+        BAD_TIMEOUT: 'error',
+        OK_SUSPICIOUS: None if suspicious_policy == 'ignore' else suspicious_policy,
+        UNTESTED: None if untested_policy == 'ignore' else untested_policy,
+    }
+
+    # files that were deleted since the run are left out, like in the html report
+    filenames = [filename for filename in select(x.filename for x in SourceFile).order_by(1)[:] if os.path.exists(filename)]
+    existing = set(filenames)
+
+    count_by_element = defaultdict(int)
+    total = 0
+    for filename, status, c in select((x.line.sourcefile.filename, x.status, count(x)) for x in Mutant)[:]:
+        if filename not in existing:
+            continue
+        count_by_element[element_by_status.get(status)] += c
+        total += c
+
+    print('<?xml version="1.0" ?>')
+    print('<testsuites {}>'.format(_xml_attributes(failures=count_by_element['failure'], errors=count_by_element['error'], tests=total, disabled=0, time='0.0')))
+    print('\t<testsuite {}>'.format(_xml_attributes(name='mutmut', disabled=0, failures=count_by_element['failure'], errors=count_by_element['error'], skipped=count_by_element['skipped'], time=0, tests=total)))
+
+    for filename in filenames:
+        update_line_numbers(filename)
+        mutants = select(
+            (x.id, x.status, x.line.line, x.index, x.line.line_number)
+            for x in Mutant
+            if x.line.sourcefile.filename == filename
+        ).order_by(1)[:]
+        if not mutants:
+            continue
+
+        needs_diff = [x for x in mutants if element_by_status.get(x[1]) is not None]
+        diff_by_id = {}
+        if needs_diff:
+            with open(filename) as f:
+                source = f.read()
+            mutation_ids = [RelativeMutationID(line=line, index=index, line_number=line_number) for _, _, line, index, line_number in needs_diff]
+            diff_by_id = dict(zip([x[0] for x in needs_diff], unified_diffs_of_file(filename, source, mutation_ids, dict_synonyms)))
+
+        for mutant_id, status, line, index, line_number in mutants:
+            print('\t\t<testcase {}>'.format(_xml_attributes(name='Mutant #{}'.format(mutant_id), file=filename, line=line_number)))
+            element = element_by_status.get(status)
+            if element is not None:
+                error_type = 'timeout' if status == BAD_TIMEOUT else element
+                print('\t\t\t<{element} {attributes}>{output}</{element}>'.format(
+                    element=element,
+                    attributes=_xml_attributes(type=error_type, message=status),
+                    output=escape(diff_by_id[mutant_id]),
+                ))
+            print('\t\t\t<system-out>{}</system-out>'.format(escape(line)))
+            print('\t\t</testcase>')
+
+    print('\t</testsuite>')
+    print('</testsuites>')
+
+
+def _write_html_page(filename, source, mutants, dict_synonyms):
+    """Write the report page of one file. This runs in a process pool so it
+    must not touch the database.
+
+    :param mutants: list of (id, status, line, index, line_number)
+    """
+    report_filename = join('html', filename)
+    os.makedirs(dirname(report_filename), exist_ok=True)
+    with open(join(report_filename + '.html'), 'w') as f:
+        mutants_by_status = defaultdict(list)
         for mutant in mutants:
-            tc = TestCase("Mutant #{}".format(mutant.id), file=filename, line=mutant.line.line_number, stdout=mutant.line.line)
-            if mutant.status == BAD_SURVIVED:
-                tc.add_failure_info(message=mutant.status, output=get_unified_diff(mutant.id, dict_synonyms))
-            if mutant.status == BAD_TIMEOUT:
-                tc.add_error_info(message=mutant.status, error_type="timeout", output=get_unified_diff(mutant.id, dict_synonyms))
-            if mutant.status == OK_SUSPICIOUS:
-                if suspicious_policy != 'ignore':
-                    func = getattr(tc, 'add_{}_info'.format(suspicious_policy))
-                    func(message=mutant.status, output=get_unified_diff(mutant.id, dict_synonyms))
-            if mutant.status == UNTESTED:
-                if untested_policy != 'ignore':
-                    func = getattr(tc, 'add_{}_info'.format(untested_policy))
-                    func(message=mutant.status, output=get_unified_diff(mutant.id, dict_synonyms))
-
-            test_cases.append(tc)
-
-    ts = TestSuite("mutmut", test_cases)
-    print(TestSuite.to_xml_string([ts]))
+            mutants_by_status[mutant[1]].append(mutant)
 
+        f.write('<html><body>')
 
-@init_db
-@db_session
-def create_html_report(dict_synonyms):
-    mutants = list(select(x for x in Mutant))
+        f.write('<h1>%s</h1>' % filename)
 
-    os.makedirs('html', exist_ok=True)
+        killed = len(mutants_by_status[OK_KILLED])
+        f.write('Killed %s out of %s mutants' % (killed, len(mutants)))
 
-    with open('html/index.html', 'w') as index_file:
-        index_file.write('<h1>Mutation testing report</h1>')
+        def print_diffs(status):
+            mutants = mutants_by_status[status]
+            mutation_ids = [RelativeMutationID(line, index, line_number) for _, _, line, index, line_number in mutants]
+            for mutant, diff in zip(mutants, unified_diffs_of_file(filename, source, mutation_ids, dict_synonyms)):
+                f.write('<h3>Mutant %s</h3>' % mutant[0])
+                f.write('<pre>%s</pre>' % html_escape(diff))
 
-        index_file.write('Killed %s out of %s mutants' % (len([x for x in mutants if x.status == OK_KILLED]), len(mutants)))
+        if mutants_by_status[BAD_TIMEOUT]:
+            f.write('<h2>Timeouts</h2>')
+            f.write('Mutants that made the test suite take a lot longer so the tests were killed.')
+            print_diffs(BAD_TIMEOUT)
 
-        index_file.write('<table><thead><tr><th>File</th><th>Total</th><th>Killed</th><th>% killed</th><th>Survived</th></thead>')
+        if mutants_by_status[BAD_SURVIVED]:
+            f.write('<h2>Survived</h2>')
+            f.write('Survived mutation testing. These mutants show holes in your test suite.')
+            print_diffs(BAD_SURVIVED)
 
-        for filename, mutants in groupby(mutants, key=lambda x: x.line.sourcefile.filename):
-            report_filename = join('html', filename)
+        if mutants_by_status[OK_SUSPICIOUS]:
+            f.write('<h2>Suspicious</h2>')
+            f.write('Mutants that made the test suite take longer, but otherwise seemed ok')
+            print_diffs(OK_SUSPICIOUS)
 
-            mutants = list(mutants)
+        f.write('</body></html>')
 
-            with open(filename) as f:
-                source = f.read()
 
-            os.makedirs(dirname(report_filename), exist_ok=True)
-            with open(join(report_filename + '.html'), 'w') as f:
-                mutants_by_status = defaultdict(list)
-                for mutant in mutants:
-                    mutants_by_status[mutant.status].append(mutant)
+def _html_report_hash(source, mutants, dict_synonyms):
+    m = hashlib.sha256()
+    m.update(source.encode('utf8'))
+    m.update(json.dumps([mutants, sorted(dict_synonyms or [])]).encode('utf8'))
+    return m.hexdigest()
 
-                f.write('<html><body>')
 
-                f.write('<h1>%s</h1>' % filename)
+@init_db
+@db_session
+def create_html_report(dict_synonyms):
+    os.makedirs('html', exist_ok=True)
 
-                killed = len(mutants_by_status[OK_KILLED])
-                f.write('Killed %s out of %s mutants' % (killed, len(mutants)))
+    pages = []
+    total = 0
+    total_killed = 0
+    for sourcefile in SourceFile.select().order_by(SourceFile.filename):
+        filename = sourcefile.filename
+        if not os.path.exists(filename):
+            continue
+        update_line_numbers(filename)
+        mutants = list(select(
+            (x.id, x.status, x.line.line, x.index, x.line.line_number)
+            for x in Mutant
+            if x.line.sourcefile == sourcefile
+        ).order_by(1))
+        if not mutants:
+            continue
 
-                index_file.write('<tr><td><a href="%s.html">%s</a></td><td>%s</td><td>%s</td><td>%.2f</td><td>%s</td>' % (
-                    filename,
-                    filename,
-                    len(mutants),
-                    killed,
-                    (killed / len(mutants) * 100),
-                    len(mutants_by_status[BAD_SURVIVED]),
-                ))
+        with open(filename) as f:
+            source = f.read()
 
-                def print_diffs(status):
-                    mutants = mutants_by_status[status]
-                    for mutant in sorted(mutants, key=lambda m: m.id):
-                        diff = _get_unified_diff(source, filename, RelativeMutationID(mutant.line.line, mutant.index, mutant.line.line_number), dict_synonyms, update_cache=False)
-                        f.write('<h3>Mutant %s</h3>' % mutant.id)
-                        f.write('<pre>%s</pre>' % diff)
+        # Only pages where the source or a status changed are written again
+        report_hash = _html_report_hash(source, mutants, dict_synonyms)
+        needs_update = report_hash != sourcefile.report_hash or not os.path.exists(join('html', filename + '.html'))
+        pages.append((filename, source, mutants, needs_update))
+        sourcefile.report_hash = report_hash
+        total += len(mutants)
+        total_killed += len([x for x in mutants if x[1] == OK_KILLED])
+
+    pages_to_write = [(filename, source, mutants, dict_synonyms) for filename, source, mutants, needs_update in pages if needs_update]
+    if len(pages_to_write) > 1:
+        with ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn')) as executor:
+            for _ in executor.map(_write_html_page, *zip(*pages_to_write)):
+                pass
+    else:
+        for args in pages_to_write:
+            _write_html_page(*args)
 
-                if mutants_by_status[BAD_TIMEOUT]:
-                    f.write('<h2>Timeouts</h2>')
-                    f.write('Mutants that made the test suite take a lot longer so the tests were killed.')
-                    print_diffs(BAD_TIMEOUT)
+    with open('html/index.html', 'w') as index_file:
+        index_file.write('<h1>Mutation testing report</h1>')
 
-                if mutants_by_status[BAD_SURVIVED]:
-                    f.write('<h2>Survived</h2>')
-                    f.write('Survived mutation testing. These mutants show holes in your test suite.')
-                    print_diffs(BAD_SURVIVED)
+        index_file.write('Killed %s out of %s mutants' % (total_killed, total))
 
-                if mutants_by_status[OK_SUSPICIOUS]:
-                    f.write('<h2>Suspicious</h2>')
-                    f.write('Mutants that made the test suite take longer, but otherwise seemed ok')
-                    print_diffs(OK_SUSPICIOUS)
+        index_file.write('<table><thead><tr><th>File</th><th>Total</th><th>Killed</th><th>% killed</th><th>Survived</th></thead>')
 
-                f.write('</body></html>')
+        for filename, source, mutants, needs_update in pages:
+            killed = len([x for x in mutants if x[1] == OK_KILLED])
+            index_file.write('<tr><td><a href="%s.html">%s</a></td><td>%s</td><td>%s</td><td>%.2f</td><td>%s</td>' % (
+                filename,
+                filename,
+                len(mutants),
+                killed,
+                (killed / len(mutants) * 100),
+                len([x for x in mutants if x[1] == BAD_SURVIVED]),
+            ))
 
         index_file.write('</table></body></html>')
 
@@ -398,24 +667,39 @@ def register_mutants(mutations_by_file):
             line = Line.get(sourcefile=sourcefile, line=mutation_id.line, line_number=mutation_id.line_number)
             if line is None:
                 raise ValueError("Obtained null line for mutation_id: {}".format(mutation_id))
-            get_or_create(Mutant, line=line, index=mutation_id.index, defaults=dict(status=UNTESTED))
+            get_or_create(Mutant, line=line, index=mutation_id.index, defaults=dict(status=UNTESTED, operator=mutation_id.operator))
 
         sourcefile.hash = hash
 
 
 @init_db
 @db_session
-def update_mutant_status(file_to_mutate, mutation_id, status, tests_hash):
+def update_mutant_status(file_to_mutate, mutation_id, status, tests_hash, test_command=None, dict_synonyms=None, durations=None, output=None, limit_reason=None):
     sourcefile = SourceFile.get(filename=file_to_mutate)
     line = Line.get(sourcefile=sourcefile, line=mutation_id.line, line_number=mutation_id.line_number)
     mutant = Mutant.get(line=line, index=mutation_id.index)
     mutant.status = status
     mutant.tested_against_hash = tests_hash
+    if durations is not None:
+        mutant.duration = durations['test']
+        mutant.mutate_duration = durations['mutate']
+        mutant.queue_duration = durations['queue']
+    if output is not None:
+        mutant.output = output
+    if limit_reason is not None:
+        mutant.limit_reason = limit_reason
+    mutant.modified = time()
+
+    if test_command is None or status not in SHARED_STATUSES:
+        return
+    key = content_hash_of_mutant(sourcefile.hash, mutation_id, tests_hash, test_command, dict_synonyms)
+    if key is not None:
+        get_or_create(ContentResult, key=key, defaults=dict(status=status)).status = status
 
 
 @init_db
 @db_session
-def get_cached_mutation_statuses(filename, mutations, hash_of_tests):
+def get_cached_mutation_statuses(filename, mutations, hash_of_tests, test_command=None, dict_synonyms=None):
     sourcefile = SourceFile.get(filename=filename)
     assert sourcefile
 
@@ -431,6 +715,8 @@ def get_cached_mutation_statuses(filename, mutations, hash_of_tests):
         mutant = Mutant.get(line=line, index=mutation_id.index)
         if mutant is None:
             mutant = get_or_create(Mutant, line=line, index=mutation_id.index, defaults=dict(status=UNTESTED))
+        if not mutant.operator and mutation_id.operator:
+            mutant.operator = mutation_id.operator
 
         result[mutation_id] = mutant.status
         if mutant.status == OK_KILLED:
@@ -445,6 +731,17 @@ def get_cached_mutation_statuses(filename, mutations, hash_of_tests):
             else:
                 result[mutation_id] = mutant.status
 
+        if result[mutation_id] == UNTESTED and test_command is not None:
+            # Someone might have tested this exact mutant already, on
+            # another branch or machine
+            key = content_hash_of_mutant(sourcefile.hash, mutation_id, hash_of_tests, test_command, dict_synonyms)
+            content_result = ContentResult.get(key=key) if key is not None else None
+            if content_result is not None and content_result.status in SHARED_STATUSES:
+                mutant.status = content_result.status
+                mutant.tested_against_hash = hash_of_tests
+                mutant.modified = time()
+                result[mutation_id] = content_result.status
+
     return result
 
 
@@ -479,6 +776,16 @@ def mutation_id_from_pk(pk):
     return RelativeMutationID(line=mutant.line.line, index=mutant.index, line_number=mutant.line.line_number)
 
 
+@init_db
+@db_session
+def mutant_test_details_from_pk(pk):
+    """The tail of the test output and the resource limit that killed the mutant."""
+    mutant = Mutant.get(id=pk)
+    if mutant is None:
+        raise ValueError("Obtained null mutant for pk: {}".format(pk))
+    return dict(output=mutant.output, limit_reason=mutant.limit_reason or None)
+
+
 @init_db
 @db_session
 def filename_and_mutation_id_from_pk(pk) -> Tuple[str, RelativeMutationID]:
@@ -497,13 +804,256 @@ def cached_test_time():
 
 @init_db
 @db_session
-def set_cached_test_time(baseline_time_elapsed, current_hash_of_tests):
+def set_cached_test_time(baseline_time_elapsed, current_hash_of_tests, dispersion=0.0):
     get_or_create(MiscData, key='baseline_time_elapsed').value = str(baseline_time_elapsed)
+    get_or_create(MiscData, key='baseline_dispersion').value = str(dispersion)
     get_or_create(MiscData, key='hash_of_tests').value = current_hash_of_tests
 
 
+@init_db
+@db_session
+def cached_test_time_dispersion():
+    """Median absolute deviation of the baseline runs, in seconds."""
+    d = MiscData.get(key='baseline_dispersion')
+    return float(d.value) if d else 0.0
+
+
+@init_db
+@db_session
+def cached_test_durations():
+    """Durations of each test in the baseline run, by pytest node id.
+
+    :rtype: dict[str, float]
+    """
+    d = MiscData.get(key='test_durations')
+    return json.loads(d.value) if d and d.value else {}
+
+
+@init_db
+@db_session
+def set_cached_test_durations(test_durations):
+    get_or_create(MiscData, key='test_durations').value = json.dumps(test_durations)
+
+
 @init_db
 @db_session
 def cached_hash_of_tests():
     d = MiscData.get(key='hash_of_tests')
     return d.value if d else None
+
+
+@init_db
+@db_session
+def export_cache(filename):
+    """Write all content addressed results to a gzipped archive that can be
+    merged into another cache with :func:`import_cache`.
+
+    :return: number of exported results
+    :rtype: int
+    """
+    count = 0
+    with gzip.open(filename, 'wt', encoding='utf8') as f:
+        f.write(json.dumps(dict(format=CACHE_ARCHIVE_FORMAT, mutmut_version=__version__)) + '\n')
+        for key, status in select((x.key, x.status) for x in ContentResult if x.status in SHARED_STATUSES):
+            f.write(json.dumps(dict(key=key, status=status)) + '\n')
+            count += 1
+    return count
+
+
+@init_db
+@db_session
+def import_cache(filename):
+    """Merge an archive created by :func:`export_cache` into the cache.
+    Results already in the cache are kept.
+
+    :return: number of imported results
+    :rtype: int
+    """
+    count = 0
+    with gzip.open(filename, 'rt', encoding='utf8') as f:
+        header = json.loads(f.readline() or '{}')
+        if header.get('format') != CACHE_ARCHIVE_FORMAT:
+            raise ValueError('{} is not a mutmut cache archive'.format(filename))
+        for line in f:
+            row = json.loads(line)
+            if row['status'] in SHARED_STATUSES and ContentResult.get(key=row['key']) is None:
+                ContentResult(key=row['key'], status=row['status'])
+                count += 1
+    return count
+
+
+@init_db
+@db_session
+def cache_row_counts():
+    return {
+        entity.__name__: entity.select().count()
+        for entity in [SourceFile, Line, Mutant, ContentResult]
+    }
+
+
+@init_db
+@db_session
+def orphaned_sourcefiles():
+    return [x.filename for x in SourceFile.select() if not os.path.exists(x.filename)]
+
+
+@init_db
+@db_session
+def orphan_ratio():
+    """Share of the Line and Mutant rows that belong to files that no longer
+    exist.
+
+    :rtype: float
+    """
+    orphans = orphaned_sourcefiles()
+    total = Line.select().count() + Mutant.select().count()
+    if not total:
+        return 0.0
+    orphaned = select(x for x in Line if x.sourcefile.filename in orphans).count() + \
+        select(x for x in Mutant if x.line.sourcefile.filename in orphans).count()
+    return orphaned / total
+
+
+@init_db
+def garbage_collect_cache():
+    """Remove the rows for deleted source files, bring the lines of changed
+    files up to date (which removes the mutants on deleted lines) and compact
+    the cache file.
+
+    The content addressed results are kept since they are still valid for
+    other branches.
+    """
+    size_before = os.path.getsize(CACHE_FILENAME)
+    counts_before = cache_row_counts()
+
+    with db_session:
+        orphans = orphaned_sourcefiles()
+        delete(x for x in Mutant if x.line.sourcefile.filename in orphans)
+        delete(x for x in Line if x.sourcefile.filename in orphans)
+        delete(x for x in SourceFile if x.filename in orphans)
+        filenames = list(select(x.filename for x in SourceFile))
+
+    for filename in filenames:
+        update_line_numbers(filename)
+
+    # VACUUM can't run inside a transaction, so it needs its own connection
+    db.disconnect()
+    connection = sqlite3.connect(CACHE_FILENAME, isolation_level=None)
+    try:
+        connection.execute('VACUUM')
+        connection.execute('ANALYZE')
+    finally:
+        connection.close()
+
+    counts_after = cache_row_counts()
+    for entity, n_before in counts_before.items():
+        print('{}: {} rows, removed {}'.format(entity, counts_after[entity], n_before - counts_after[entity]))
+    size_after = os.path.getsize(CACHE_FILENAME)
+    print('Cache size: {} bytes, reclaimed {} bytes'.format(size_after, size_before - size_after))
+
+
+@init_db
+@db_session
+def export_results(export_format, dict_synonyms, since=None):
+    """Print one JSON object per mutant, file by file, so the whole cache is
+    never loaded at once.
+
+    :param export_format: 'ndjson' for one object per line or 'json' for a list
+    :param since: only export mutants whose status changed after this unix
+        time, or after the previous export if it's 'last'
+    """
+    if since == 'last':
+        last_export = MiscData.get(key='last_export')
+        since = float(last_export.value) if last_export else None
+    elif since is not None:
+        since = float(since)
+    get_or_create(MiscData, key='last_export').value = str(time())
+
+    separator = ''
+    if export_format == 'json':
+        sys.stdout.write('[')
+
+    for filename in select(x.filename for x in SourceFile).order_by(1)[:]:
+        if os.path.exists(filename):
+            update_line_numbers(filename)
+        if since is None:
+            query = select(x for x in Mutant if x.line.sourcefile.filename == filename)
+        else:
+            query = select(x for x in Mutant if x.line.sourcefile.filename == filename and x.modified > since)
+        mutants = select(
+            (x.id, x.status, x.line.line, x.index, x.line.line_number, x.operator, x.duration, x.modified)
+            for x in query
+        ).order_by(1)[:]
+        if not mutants:
+            continue
+
+        if os.path.exists(filename):
+            with open(filename) as f:
+                source = f.read()
+            mutation_ids = [RelativeMutationID(line=x[2], index=x[3], line_number=x[4]) for x in mutants]
+            diffs = unified_diffs_of_file(filename, source, mutation_ids, dict_synonyms)
+        else:
+            diffs = [None] * len(mutants)
+
+        for (mutant_id, status, line, index, line_number, operator, duration, modified), diff in zip(mutants, diffs):
+            row = dict(
+                id=mutant_id,
+                filename=filename,
+                line_number=line_number + 1,
+                line=line,
+                operator=operator or None,
+                status=status,
+                duration=duration,
+                modified=modified,
+                diff=diff,
+            )
+            if export_format == 'json':
+                sys.stdout.write(separator + json.dumps(row))
+                separator = ','
+            else:
+                sys.stdout.write(json.dumps(row) + '\n')
+
+    if export_format == 'json':
+        sys.stdout.write(']\n')
+
+
+def _format_seconds(seconds):
+    return '{:.1f}s'.format(seconds or 0.0)
+
+
+@init_db
+@db_session
+def print_stats(limit=10):
+    """Print where the time of the mutation testing runs went, using the
+    timings stored for each mutant.
+    """
+    timed = select(x for x in Mutant if x.duration is not None or x.mutate_duration is not None)
+    count_timed, test_time, mutate_time, queue_time = select(
+        (count(x), sum(x.duration), sum(x.mutate_duration), sum(x.queue_duration)) for x in timed
+    ).first()
+    if not count_timed:
+        print('No timings in the cache yet, run `mutmut run` first')
+        return
+
+    test_time = test_time or 0.0
+    mutate_time = mutate_time or 0.0
+    print('Timed mutants: {}'.format(count_timed))
+    print('Running tests: {} ({:.0%})'.format(_format_seconds(test_time), test_time / ((test_time + mutate_time) or 1)))
+    print('mutmut overhead: {} ({:.0%})'.format(_format_seconds(mutate_time), mutate_time / ((test_time + mutate_time) or 1)))
+    print('Waiting in the queue: {}'.format(_format_seconds(queue_time)))
+
+    timeout_count, timeout_time = select((count(x), sum(x.duration)) for x in timed if x.status == BAD_TIMEOUT).first()
+    print('Timeouts: {} costing {}'.format(timeout_count, _format_seconds(timeout_time)))
+
+    def print_slowest(title, rows):
+        print('')
+        print(title)
+        for name, c, total in rows:
+            print('    {:<40} {:>6} mutants {:>10} {:>10}/mutant'.format(name or '?', c, _format_seconds(total), _format_seconds((total or 0.0) / c)))
+
+    print_slowest('Slowest files:', select(
+        (x.line.sourcefile.filename, count(x), sum(x.duration) + sum(x.mutate_duration)) for x in timed
+    ).order_by(-3).limit(limit))
+    print_slowest('Slowest operators:', select(
+        (x.operator, count(x), sum(x.duration) + sum(x.mutate_duration)) for x in timed
+    ).order_by(-3).limit(limit))
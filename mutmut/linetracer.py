@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""Records the lines that run in a Python process, for ``--collect-coverage``.
+
+mutmut copies this file as ``sitecustomize.py`` into a temporary directory
+on the ``PYTHONPATH`` of the baseline test run, so it runs at the startup of
+every Python process of the tests, including subprocesses like pytest-xdist
+workers. Each process writes the lines it ran to ``<pid>.json`` in the
+directory in ``MUTMUT_COVERAGE_OUTPUT``. Only files under
+``MUTMUT_COVERAGE_ROOT`` outside of site-packages are recorded.
+
+This module must only use the standard library. If the project has its own
+``sitecustomize`` it is shadowed during the baseline run.
+
+Tools like coverage.py that install a trace function of their own, e.g. via
+pytest-cov, don't replace this one: both are called.
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+
+OUTPUT_ENV = 'MUTMUT_COVERAGE_OUTPUT'
+ROOT_ENV = 'MUTMUT_COVERAGE_ROOT'
+
+
+def start(output_dir, root):
+    lines_by_filename = {}
+    root = os.path.join(root, '')
+    wanted_by_filename = {}
+
+    def wanted(filename):
+        try:
+            return wanted_by_filename[filename]
+        except KeyError:
+            result = filename.startswith(root) and 'site-packages' not in filename
+            wanted_by_filename[filename] = result
+            return result
+
+    if hasattr(sys, 'monitoring'):  # pragma: no cover (python 3.12+)
+        monitoring = sys.monitoring
+        # leave COVERAGE_ID to coverage.py, in case it uses sys.monitoring too
+        tool_id = next(i for i in (4, 3, monitoring.COVERAGE_ID) if monitoring.get_tool(i) is None)
+        monitoring.use_tool_id(tool_id, 'mutmut')
+
+        def line(code, line_number):
+            if wanted(code.co_filename):
+                lines_by_filename.setdefault(code.co_filename, set()).add(line_number)
+            # every line only needs to be seen once
+            return monitoring.DISABLE
+
+        monitoring.register_callback(tool_id, monitoring.events.LINE, line)
+        monitoring.set_events(tool_id, monitoring.events.LINE)
+    else:
+        def trace(frame, event, arg):
+            filename = frame.f_code.co_filename
+            if not wanted(filename):
+                return None
+            lines = lines_by_filename.setdefault(filename, set())
+            # coverage.py turns off line events of the files it doesn't measure
+            frame.f_trace_lines = True
+
+            def trace_lines(frame, event, arg):
+                if event == 'line':
+                    lines.add(frame.f_lineno)
+                return trace_lines
+
+            return trace_lines
+
+        # The C tracer of coverage.py installs itself past sys.settrace
+        os.environ.setdefault('COVERAGE_CORE', 'pytrace')
+
+        settrace = sys.settrace
+        gettrace = sys.gettrace
+        threading_settrace = threading.settrace
+        # the trace function others installed in this thread, and ours around it
+        installed = threading.local()
+
+        def chain(ours, theirs):
+            if theirs is None:
+                return ours
+
+            def both(frame, event, arg):
+                # Python only calls the trace function of a frame while a
+                # global one is installed, so theirs must not see events after
+                # they uninstalled theirs
+                next_theirs = theirs(frame, event, arg) if getattr(installed, 'theirs', None) is not None else theirs
+                next_ours = ours(frame, event, arg) if ours is not None else None
+                if next_ours is ours and next_theirs is theirs:
+                    return both
+                return chain(next_ours, next_theirs)
+
+            return both
+
+        def settrace_too(function):
+            if function is trace:  # from threading.settrace below
+                function = None
+            installed.theirs = function
+            installed.chained = chain(trace, function)
+            settrace(installed.chained)
+
+        def gettrace_theirs():
+            # others must see their own trace function, or think it was replaced
+            current = gettrace()
+            if current is not None and current is getattr(installed, 'chained', None):
+                return installed.theirs
+            return current
+
+        sys.settrace = settrace_too
+        sys.gettrace = gettrace_theirs
+        # new threads pass the hook to sys.settrace
+        threading.settrace = lambda function: threading_settrace(trace if function is None else function)
+        sys.settrace(None)
+        threading.settrace(None)
+
+    def write():
+        with open(os.path.join(output_dir, '{}.json'.format(os.getpid())), 'w') as f:
+            json.dump({filename: sorted(lines) for filename, lines in lines_by_filename.items()}, f)
+
+    atexit.register(write)
+
+
+def read(output_dir):
+    """Merge the lines recorded by all processes.
+
+    :return: line numbers by absolute filename, like :func:`mutmut.read_coverage_data`
+    :rtype: dict[str, set[int]]
+    """
+    result = {}
+    for entry in os.listdir(output_dir):
+        if not entry.endswith('.json'):
+            continue
+        with open(os.path.join(output_dir, entry)) as f:
+            for filename, lines in json.load(f).items():
+                result.setdefault(filename, set()).update(lines)
+    return result
+
+
+if os.environ.get(OUTPUT_ENV):
+    start(os.environ[OUTPUT_ENV], os.environ.get(ROOT_ENV, os.getcwd()))
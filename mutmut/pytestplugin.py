@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""pytest plugin that mutmut loads into the test command when it runs pytest.
+
+It records how long each test takes during the baseline run, and during the
+mutation testing it kills the test run as soon as one test takes much
+longer than it did in the baseline, instead of waiting for the timeout of
+the whole test suite.
+
+mutmut copies this file next to the tests instead of importing it from the
+mutmut package, because the test command might run in another environment
+than mutmut. So this module must only use the standard library.
+"""
+
+import json
+import os
+import threading
+
+# Where to write the durations of the tests, as a JSON object of node id to seconds
+DURATIONS_OUTPUT_ENV = 'MUTMUT_TEST_DURATIONS_OUTPUT'
+
+# A JSON file with the time limit of each test, see write_time_limits
+TIME_LIMITS_ENV = 'MUTMUT_TEST_TIME_LIMITS'
+
+# Exit code of a test run that was stopped because a test took too long,
+# the same as the one of GNU timeout
+TIMEOUT_EXIT_CODE = 124
+
+durations = {}
+time_limits = {}
+timer = None
+
+
+def write_time_limits(filename, test_durations, multiplier, minimum):
+    """Write the time limit of each test, ``multiplier`` times its baseline
+    duration but at least ``minimum`` seconds."""
+    with open(filename, 'w') as f:
+        json.dump({
+            nodeid: max(duration * multiplier, minimum)
+            for nodeid, duration in test_durations.items()
+        }, f)
+
+
+def pytest_configure(config):
+    filename = os.environ.get(TIME_LIMITS_ENV)
+    if filename:
+        with open(filename) as f:
+            time_limits.update(json.load(f))
+
+
+def pytest_runtest_logreport(report):
+    # setup, call and teardown all count
+    durations[report.nodeid] = durations.get(report.nodeid, 0.0) + report.duration
+
+
+def pytest_runtest_logstart(nodeid, location):
+    global timer
+    if nodeid not in time_limits:
+        return
+
+    def timeout():
+        os.write(2, '\nmutmut: {} took more than {:.3f} seconds\n'.format(nodeid, time_limits[nodeid]).encode())
+        os._exit(TIMEOUT_EXIT_CODE)
+
+    timer = threading.Timer(time_limits[nodeid], timeout)
+    timer.daemon = True
+    timer.start()
+
+
+def pytest_runtest_logfinish(nodeid, location):
+    global timer
+    if timer is not None:
+        timer.cancel()
+        timer = None
+
+
+def pytest_sessionfinish(session, exitstatus):
+    filename = os.environ.get(DURATIONS_OUTPUT_ENV)
+    if filename:
+        with open(filename, 'w') as f:
+            json.dump(durations, f)
@@ -0,0 +1,43 @@
+-- version 6 with Mutant.operator, Mutant.duration and Mutant.modified
+CREATE TABLE "MiscData" (
+  "key" TEXT NOT NULL PRIMARY KEY,
+  "value" TEXT NOT NULL
+);
+CREATE TABLE "SourceFile" (
+  "id" INTEGER PRIMARY KEY AUTOINCREMENT,
+  "filename" TEXT NOT NULL,
+  "hash" TEXT NOT NULL,
+  "report_hash" TEXT NOT NULL
+);
+CREATE TABLE "Line" (
+  "id" INTEGER PRIMARY KEY AUTOINCREMENT,
+  "sourcefile" INTEGER NOT NULL REFERENCES "SourceFile" ("id") ON DELETE CASCADE,
+  "line" TEXT NOT NULL,
+  "line_number" INTEGER NOT NULL
+);
+CREATE INDEX "idx_line__sourcefile" ON "Line" ("sourcefile");
+CREATE TABLE "Mutant" (
+  "id" INTEGER PRIMARY KEY AUTOINCREMENT,
+  "line" INTEGER NOT NULL REFERENCES "Line" ("id") ON DELETE CASCADE,
+  "index" INTEGER NOT NULL,
+  "tested_against_hash" TEXT NOT NULL,
+  "status" TEXT NOT NULL,
+  "operator" TEXT NOT NULL,
+  "duration" REAL,
+  "modified" REAL
+);
+CREATE INDEX "idx_mutant__line" ON "Mutant" ("line");
+CREATE INDEX "idx_mutant__status" ON "Mutant" ("status");
+CREATE TABLE "ContentResult" (
+  "key" TEXT NOT NULL PRIMARY KEY,
+  "status" TEXT NOT NULL
+);
+
+INSERT INTO "MiscData" VALUES ('version', '7');
+INSERT INTO "MiscData" VALUES ('baseline_time_elapsed', '1.5');
+INSERT INTO "MiscData" VALUES ('hash_of_tests', 'tests-hash');
+INSERT INTO "SourceFile" VALUES (1, 'foo.py', 'source-hash', '');
+INSERT INTO "Line" VALUES (1, 1, 'def foo(a, b):', 0);
+INSERT INTO "Line" VALUES (2, 1, '    return a < b', 1);
+INSERT INTO "Mutant" VALUES (1, 2, 0, 'tests-hash', 'ok_killed', 'operator', 0.5, 1600000000.0);
+INSERT INTO "Mutant" VALUES (2, 2, 1, 'tests-hash', 'bad_survived', 'operator', 0.5, 1600000000.0);
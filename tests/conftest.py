@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+
+@pytest.fixture
+def forget_cache_db():
+    yield
+
+    # This is a hack to get pony to forget about the old db file
+    # otherwise Pony thinks we've already created the tables
+    import mutmut.cache
+    mutmut.cache.db.disconnect()
+    mutmut.cache.db.provider = None
+    mutmut.cache.db.schema = None
@@ -1,4 +1,19 @@
-from mutmut.cache import sequence_ops
+import os
+import sqlite3
+from glob import glob
+
+import pytest
+
+from mutmut import RelativeMutationID
+from mutmut.cache import sequence_ops, cached_test_time, cached_mutation_status, current_db_version
+
+schema_fixtures = sorted(glob(os.path.join(os.path.dirname(__file__), 'cache_schemas', 'version_*.sql')))
+
+
+@pytest.fixture
+def empty_dir(tmpdir, forget_cache_db):
+    os.chdir(str(tmpdir))
+    return tmpdir
 
 
 def test_sequence_ops():
@@ -38,3 +53,102 @@ def test_sequence_ops():
         ('equal', 'f', 5, 'f', 6),
         ('delete', 'g', 6, None, None),
     ]
+
+
+@pytest.mark.parametrize('schema_fixture', schema_fixtures, ids=os.path.basename)
+def test_migrate_db_keeps_results(schema_fixture, empty_dir):
+    with open(schema_fixture) as f:
+        connection = sqlite3.connect('.mutmut-cache')
+        connection.executescript(f.read())
+        connection.close()
+
+    assert cached_test_time() == 1.5
+    mutation_id = RelativeMutationID(line='    return a < b', index=1, line_number=1)
+    assert cached_mutation_status('foo.py', mutation_id, 'tests-hash') == 'bad_survived'
+
+    connection = sqlite3.connect('.mutmut-cache')
+    assert connection.execute("SELECT value FROM MiscData WHERE key = 'version'").fetchone() == (str(current_db_version),)
+    connection.close()
+
+
+@pytest.mark.parametrize('version', ['1', '2', '3', None])
+def test_migrate_db_clears_versions_without_migrations(empty_dir, version):
+    connection = sqlite3.connect('.mutmut-cache')
+    connection.executescript("""
+        CREATE TABLE "MiscData" ("key" TEXT NOT NULL PRIMARY KEY, "value" TEXT NOT NULL);
+        INSERT INTO "MiscData" VALUES ('baseline_time_elapsed', '1.5');
+    """)
+    if version is not None:
+        connection.execute("""INSERT INTO "MiscData" VALUES ('version', ?)""", (version,))
+    connection.commit()
+    connection.close()
+
+    assert cached_test_time() is None
+
+
+def test_migrate_db_rolls_back_a_failed_step(empty_dir, monkeypatch):
+    from mutmut.cache import migrate_db, migrations
+    with open(os.path.join(os.path.dirname(__file__), 'cache_schemas', 'version_8.sql')) as f:
+        connection = sqlite3.connect('.mutmut-cache')
+        connection.executescript(f.read())
+        connection.close()
+
+    def broken_migration(cursor):
+        cursor.execute('ALTER TABLE "Mutant" ADD COLUMN "limit_reason" TEXT NOT NULL DEFAULT \'\'')
+        raise KeyboardInterrupt()
+
+    monkeypatch.setitem(migrations, 9, broken_migration)
+    with pytest.raises(KeyboardInterrupt):
+        migrate_db('.mutmut-cache')
+
+    # the step before it is done, the broken one not at all
+    connection = sqlite3.connect('.mutmut-cache')
+    assert connection.execute("SELECT value FROM MiscData WHERE key = 'version'").fetchone() == ('9',)
+    columns = [x[1] for x in connection.execute('PRAGMA table_info("Mutant")')]
+    assert 'output' in columns
+    assert 'limit_reason' not in columns
+    connection.close()
+
+
+def test_schema_fixture_for_every_migrated_version():
+    from mutmut.cache import migrations
+    fixture_versions = {int(os.path.basename(x)[len('version_'):-len('.sql')]) for x in schema_fixtures}
+    assert set(migrations) | {current_db_version} <= fixture_versions
+
+
+def test_hash_of_tests_is_the_same_for_the_same_tests(tmpdir):
+    from mutmut.cache import hash_of_tests
+    for name in ['a', 'b']:
+        tmpdir.join(name, 'tests', 'test_foo.py').write('def test_foo():\n    pass\n', ensure=True)
+        tmpdir.join(name, 'tests', 'data', 'input.txt').write('1 2 3\n', ensure=True)
+    # bytecode differs between python versions and runs
+    tmpdir.join('b', 'tests', '__pycache__', 'test_foo.cpython-311-pytest-7.4.0.pyc').write_binary(b'\x00\x01', ensure=True)
+    tmpdir.join('b', 'tests', 'data', 'input.pyc').write_binary(b'\x00\x01', ensure=True)
+
+    a = hash_of_tests([str(tmpdir.join('a', 'tests'))])
+    assert a == hash_of_tests([str(tmpdir.join('b', 'tests'))])
+
+    # the same contents in other files are other tests
+    tmpdir.join('a', 'tests', 'data', 'input.txt').rename(tmpdir.join('a', 'tests', 'data', 'other.txt'))
+    assert hash_of_tests([str(tmpdir.join('a', 'tests'))]) != a
+
+
+def test_only_killed_and_survived_results_are_shared(empty_dir):
+    from mutmut import Context, list_mutations
+    from mutmut.cache import cache_row_counts, get_cached_mutation_statuses, register_mutants, update_line_numbers, update_mutant_status
+    source = 'def foo():\n    return 1 + 2 - 3\n'
+    empty_dir.join('foo.py').write(source)
+    update_line_numbers('foo.py')
+    mutations = list_mutations(Context(filename='foo.py'))
+    register_mutants({'foo.py': mutations})
+    statuses = ['ok_killed', 'bad_survived', 'bad_timeout', 'ok_suspicious']
+    for mutation_id, status in zip(mutations, statuses):
+        update_mutant_status('foo.py', mutation_id, status, 'tests-hash', 'pytest')
+    assert cache_row_counts()['ContentResult'] == 2
+
+    # the same code elsewhere only gets the shared results
+    empty_dir.join('bar.py').write(source)
+    update_line_numbers('bar.py')
+    register_mutants({'bar.py': mutations})
+    cached = get_cached_mutation_statuses('bar.py', mutations, 'tests-hash', 'pytest')
+    assert [cached[x] for x in mutations[:4]] == ['ok_killed', 'bad_survived', 'untested', 'untested']
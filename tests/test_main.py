@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import json
 import os
+import pickle
 import subprocess
 import sys
 import xml.etree.ElementTree as ET
@@ -8,7 +10,7 @@ from os import (
     mkdir,
 )
 from os.path import join
-from time import time
+from time import process_time, sleep, time
 from unittest.mock import (
     call,
     MagicMock,
@@ -18,12 +20,28 @@ import pytest
 from click.testing import CliRunner
 
 from mutmut import (
+    BaselineMonitor,
     compute_exit_code,
+    git_recent_commits,
+    parse_target_selector,
+    config_for_file,
+    CoverageIndex,
+    estimate_mutation_score,
+    covered_lines,
     popen_streaming_output,
     Progress,
     python_source_files,
     read_coverage_data,
+    recently_changed_lines,
+    RelativeMutationID,
+    pytest_plugin_environment,
+    ResourceLimitExceeded,
+    sample_mutations,
+    selected_tests,
+    SequentialTest,
+    Supervisor,
 )
+from mutmut.pytestplugin import write_time_limits
 from mutmut.__main__ import climain
 
 file_to_mutate_lines = [
@@ -59,29 +77,15 @@ def test_foo():
 
 
 @pytest.fixture
-def filesystem(tmpdir):
+def filesystem(tmpdir, forget_cache_db):
     create_filesystem(tmpdir, file_to_mutate_contents, test_file_contents)
-
-    yield tmpdir
-
-    # This is a hack to get pony to forget about the old db file
-    # otherwise Pony thinks we've already created the tables
-    import mutmut.cache
-    mutmut.cache.db.provider = None
-    mutmut.cache.db.schema = None
+    return tmpdir
 
 
 @pytest.fixture
-def single_mutant_filesystem(tmpdir):
+def single_mutant_filesystem(tmpdir, forget_cache_db):
     create_filesystem(tmpdir, "def foo():\n    return 1\n", "from foo import *\ndef test_foo():\n    assert foo() == 1")
-
-    yield tmpdir
-
-    # This is a hack to get pony to forget about the old db file
-    # otherwise Pony thinks we've already created the tables
-    import mutmut.cache
-    mutmut.cache.db.provider = None
-    mutmut.cache.db.schema = None
+    return tmpdir
 
 
 def create_filesystem(tmpdir, file_to_mutate_contents, test_file_contents):
@@ -153,7 +157,145 @@ def test_compute_return_code():
 
 
 def test_read_coverage_data(filesystem):
-    assert read_coverage_data() == {}
+    assert list(read_coverage_data()) == []
+
+
+def test_coverage_index(tmpdir):
+    index = CoverageIndex.write(str(tmpdir.join('index')), [('/a.py', [1, 3, 200]), ('/b.py', [])])
+    assert sorted(index) == ['/a.py', '/b.py']
+    assert index.get('/a.py') == {1, 3, 200}
+    assert index.get('/b.py') == set()
+    assert index.get('/c.py') is None
+
+    pickled = pickle.dumps(index)
+    assert b'200' not in pickled
+    assert pickle.loads(pickled).get('/a.py') == {1, 3, 200}
+
+
+def test_config_for_file_only_has_the_coverage_of_the_file(tmpdir):
+    config = MagicMock()
+    config.covered_lines_by_filename = {}
+    index = CoverageIndex.write(str(tmpdir.join('index')), [(os.path.abspath('a.py'), [1]), (os.path.abspath('b.py'), [2])])
+    config.line_filters = [index.lines_of]
+
+    file_config = config_for_file(config, 'a.py')
+    assert file_config.covered_lines_by_filename == {'a.py': {1}}
+    assert file_config.line_filters is None
+
+
+def test_queued_mutants_get_the_latest_baseline(filesystem):
+    import queue
+    from threading import Thread
+    from mutmut import Context, list_mutations, queue_mutants
+    from mutmut.cache import register_mutants, update_line_numbers
+
+    update_line_numbers('foo.py')
+    mutations = list_mutations(Context(filename='foo.py', dict_synonyms=['']))
+    register_mutants({'foo.py': mutations})
+
+    config = MagicMock()
+    config.hash_of_tests = 'hash'
+    config.test_command = 'python -m hammett -x'
+    config.dict_synonyms = ['']
+    config.covered_lines_by_filename = {'foo.py': {1, 2, 3, 4, 5, 6, 7, 8}}
+    config.baseline_time_elapsed = 1.0
+    mutants_queue = queue.Queue(maxsize=1)
+    thread = Thread(target=queue_mutants, daemon=True, kwargs=dict(progress=MagicMock(), config=config, mutants_queue=mutants_queue, mutations_by_file={'foo.py': mutations}))
+    thread.start()
+
+    assert mutants_queue.get()[1].config.baseline_time_elapsed == 1.0
+    # recalibrated by the BaselineMonitor while the rest of the file is queued
+    config.baseline_time_elapsed = 2.0
+    mutants_queue.get()
+    command, context = mutants_queue.get()
+    assert context.config.baseline_time_elapsed == 2.0
+    assert context.config.covered_lines_by_filename == {'foo.py': {1, 2, 3, 4, 5, 6, 7, 8}}
+
+
+def test_covered_lines_intersects_the_line_filters():
+    config = MagicMock()
+    config.covered_lines_by_filename = {}
+    no_more_filters = MagicMock()
+    config.line_filters = [{'a.py': {1, 2, 3}, 'b.py': {1}}.get, {'a.py': [2, 3, 4], 'b.py': [2]}.get, no_more_filters]
+    no_more_filters.return_value = {3}
+
+    assert covered_lines(config, 'a.py') == {3}
+    assert covered_lines(config, 'b.py') is None
+    assert covered_lines(config, 'c.py') is None
+    no_more_filters.assert_called_once_with('a.py')
+
+
+def test_parse_target_selector(tmpdir):
+    assert parse_target_selector('foo.py') is None
+    assert parse_target_selector('C:\\foo.py') is None
+
+    path, line_filter = parse_target_selector('foo.py:3-5')
+    assert path == 'foo.py'
+    assert line_filter('foo.py') == {3, 4, 5}
+    assert parse_target_selector('src/*.py:7')[1]('src/a.py') == {7}
+
+    filename = str(tmpdir.join('foo.py'))
+    with open(filename, 'w') as f:
+        f.write("""def foo():
+    return 1
+
+
+class Bar:
+    @property
+    def foo(self):
+        return 2
+
+    def baz(self):
+        def foo():
+            return 3
+        return foo()
+""")
+    path, line_filter = parse_target_selector(filename + '::Bar.foo')
+    assert path == filename
+    assert line_filter(filename) == {6, 7, 8}
+    assert parse_target_selector('x::foo')[1](filename) == {1, 2}
+    assert parse_target_selector('x::*foo')[1](filename) == {1, 2, 6, 7, 8, 11, 12}
+    assert parse_target_selector('x::Bar')[1](filename) == set(range(5, 14))
+
+    with open(filename, 'w') as f:
+        f.write("""@lru_cache(maxsize=3)
+async def f():
+    return 1
+
+
+class Bar:
+    @property
+    async def g(self):
+        return 2
+""")
+    assert parse_target_selector('x::f')[1](filename) == {1, 2, 3}
+    assert parse_target_selector('x::Bar.g')[1](filename) == {7, 8, 9}
+
+
+def test_recently_changed_lines(tmpdir):
+    os.chdir(str(tmpdir))
+
+    def git(*args):
+        subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(args), check=True, stdout=subprocess.DEVNULL)
+
+    git('init', '-q')
+    with open('foo.py', 'w') as f:
+        f.write('a = 1\nb = 2\nc = 3\n')
+    git('add', 'foo.py')
+    git('commit', '-q', '-m', 'first')
+    with open('foo.py', 'w') as f:
+        f.write('a = 1\nb = 4\nc = 3\n')
+    git('commit', '-q', '-a', '-m', 'second')
+    with open('foo.py', 'w') as f:
+        f.write('a = 1\nb = 4\nc = 5\n')
+    with open('bar.py', 'w') as f:
+        f.write('x = 1\ny = 2\n')
+
+    assert recently_changed_lines(git_recent_commits(1), 'foo.py') == {2, 3}
+    assert recently_changed_lines(git_recent_commits(2), 'foo.py') == {1, 2, 3}
+    # uncommitted changes count as recent
+    assert recently_changed_lines(git_recent_commits(0), 'foo.py') == {3}
+    assert recently_changed_lines(git_recent_commits(1), 'bar.py') == {1, 2}
 
 
 @pytest.mark.parametrize(
@@ -211,6 +353,134 @@ def test_popen_streaming_output_timeout():
     assert (time() - start) < 3
 
 
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='looks in /proc')
+def test_popen_streaming_output_timeout_kills_process_group(tmpdir):
+    pid_file = str(tmpdir.join('pid'))
+    with pytest.raises(TimeoutError):
+        popen_streaming_output(
+            PYTHON + ' -c "import subprocess, sys, time; p = subprocess.Popen([sys.executable, \'-c\', \'import time; time.sleep(30)\']); open(\'{}\', \'w\').write(str(p.pid)); time.sleep(30)"'.format(pid_file),
+            lambda line: line, timeout=1,
+        )
+
+    with open(pid_file) as f:
+        grandchild_pid = int(f.read())
+
+    def alive(pid):
+        try:
+            with open('/proc/{}/status'.format(pid)) as f:
+                return 'State:\tZ' not in f.read()
+        except FileNotFoundError:
+            return False
+
+    for _ in range(50):
+        if not alive(grandchild_pid):
+            break
+        sleep(0.1)
+    assert not alive(grandchild_pid)
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='needs start_new_session')
+def test_popen_streaming_output_without_pidfd_or_waitid(monkeypatch):
+    # like on macOS: the processes are polled and reaped as soon as they exit
+    monkeypatch.delattr(os, 'pidfd_open', raising=False)
+    monkeypatch.delattr(os, 'waitid', raising=False)
+
+    output = []
+    assert popen_streaming_output(PYTHON + ' -c "print(\'hello\'); exit(3)"', output.append) == 3
+    assert output == ['hello\n']
+
+    with pytest.raises(TimeoutError):
+        popen_streaming_output(PYTHON + ' -c "import time; time.sleep(4)"', lambda line: line, timeout=0.1)
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='needs start_new_session')
+def test_popen_streaming_output_does_not_wait_for_escaped_processes():
+    output = []
+    start = time()
+    cpu_start = process_time()
+    returncode = popen_streaming_output(
+        PYTHON + ' -c "import subprocess, sys; subprocess.Popen([sys.executable, \'-c\', \'import time; time.sleep(8)\'], start_new_session=True); print(\'done\')"',
+        output.append,
+    )
+    assert returncode == 0
+    assert output == ['done\n']
+    assert time() - start < 5
+    assert process_time() - cpu_start < 2
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='setrlimit is not available on Windows')
+def test_popen_streaming_output_memory_limit():
+    with pytest.raises(ResourceLimitExceeded) as e:
+        popen_streaming_output(
+            PYTHON + ' -c "x = bytearray(2 * 1024 ** 3)"',
+            lambda line: line, timeout=10, resource_limits=dict(address_space=512 * 1024 ** 2),
+        )
+    assert e.value.reason == 'memory limit'
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='setrlimit is not available on Windows')
+def test_popen_streaming_output_cpu_limit():
+    with pytest.raises(ResourceLimitExceeded) as e:
+        popen_streaming_output(
+            PYTHON + ' -c "while True: pass"',
+            lambda line: line, timeout=10, resource_limits=dict(cpu=1),
+        )
+    assert e.value.reason == 'cpu limit'
+
+    # failing tests within the limits are just failing tests
+    assert popen_streaming_output(PYTHON + ' -c "exit(1)"', lambda line: line, resource_limits=dict(cpu=1)) == 1
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='setrlimit is not available on Windows')
+def test_popen_streaming_output_limit_markers_need_a_fitting_failure():
+    import resource
+    # limits that are never hit
+    limits = dict(address_space=resource.getrlimit(resource.RLIMIT_AS)[0], processes=resource.getrlimit(resource.RLIMIT_NPROC)[0])
+    # EAGAIN from non-blocking IO is no process limit
+    assert popen_streaming_output(
+        PYTHON + ' -c "raise BlockingIOError(11, \'Resource temporarily unavailable\')"',
+        lambda line: line, resource_limits=limits,
+    ) == 1
+    # only the end of the output counts
+    assert popen_streaming_output(
+        PYTHON + ' -c "print(\'MemoryError\'); print(\'\\n\' * 50); exit(1)"',
+        lambda line: line, resource_limits=limits,
+    ) == 1
+    # testmon exits with 5 when there was nothing to test
+    assert popen_streaming_output(
+        PYTHON + ' -c "print(\'MemoryError\'); exit(5)"',
+        lambda line: line, resource_limits=limits, passing_returncodes=(0, 5),
+    ) == 5
+    with pytest.raises(ResourceLimitExceeded):
+        popen_streaming_output(PYTHON + ' -c "print(\'MemoryError\'); exit(5)"', lambda line: line, resource_limits=limits)
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='setrlimit is not available on Windows')
+def test_popen_streaming_output_sigkill_within_the_cpu_limit():
+    with pytest.raises(ResourceLimitExceeded) as e:
+        popen_streaming_output(
+            PYTHON + ' -c "import os, signal; os.kill(os.getpid(), signal.SIGKILL)"',
+            lambda line: line, timeout=10, resource_limits=dict(cpu=5),
+        )
+    assert e.value.reason == 'killed'
+    assert str(e.value) == 'the test command was killed'
+
+
+def test_supervisor_runs_processes_concurrently():
+    outputs = [[], []]
+    supervisor = Supervisor()
+    start = time()
+    processes = [
+        supervisor.spawn(PYTHON + ' -c "import time; time.sleep(1); print({})"'.format(i), outputs[i].append)
+        for i in range(2)
+    ]
+    supervisor.run()
+
+    assert time() - start < 1.9
+    assert [p.returncode for p in processes] == [0, 0]
+    assert outputs == [['0\n'], ['1\n']]
+
+
 def test_popen_streaming_output_stream():
     mock = MagicMock()
     popen_streaming_output(
@@ -441,3 +711,594 @@ def test_pre_and_post_mutation_hook(single_mutant_filesystem, tmpdir):
     assert "pre mutation stub" in result.output
     assert "post mutation stub" in result.output
     assert result.output.index("pre mutation stub") < result.output.index("post mutation stub")
+
+
+def test_cache_export_import(filesystem):
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0"], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+
+    result = CliRunner().invoke(climain, ['cache', 'export', 'results.json.gz'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    assert 'Exported {} results'.format(EXPECTED_MUTANTS) in result.output
+
+    # start over with an empty cache, like a fresh CI job would
+    import mutmut.cache
+    mutmut.cache.db.disconnect()
+    mutmut.cache.db.provider = None
+    mutmut.cache.db.schema = None
+    os.unlink('.mutmut-cache')
+
+    result = CliRunner().invoke(climain, ['cache', 'import', 'results.json.gz'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    assert 'Imported {} new results'.format(EXPECTED_MUTANTS) in result.output
+
+    from mutmut import Context, list_mutations
+    from mutmut.cache import get_cached_mutation_statuses, hash_of_tests, register_mutants, update_line_numbers
+    update_line_numbers('foo.py')
+    mutations = list_mutations(Context(filename='foo.py', dict_synonyms=['']))
+    register_mutants({'foo.py': mutations})
+    statuses = get_cached_mutation_statuses('foo.py', mutations, hash_of_tests(['tests']), 'python -m hammett -x', [''])
+    assert set(statuses.values()) == {'ok_killed'}
+
+
+def test_recover_from_journal(filesystem):
+    from mutmut import Context, journal_begin, journal_path, mutate_file, recover_from_journal
+
+    # simulate mutmut being killed while a mutant is on disk
+    journal_begin('foo.py')
+    mutate_file(backup=True, context=Context(filename='foo.py', mutation_id=RelativeMutationID(line='    return a < b', index=0, line_number=1)))
+    with open('foo.py') as f:
+        assert f.read() != file_to_mutate_contents
+
+    # this process is still running, so it's not touched
+    assert recover_from_journal() == []
+    with open('foo.py') as f:
+        assert f.read() != file_to_mutate_contents
+
+    dead_process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead_process.wait()
+    os.replace(journal_path(), os.path.join('.mutmut-journal', '{}.json'.format(dead_process.pid)))
+
+    assert recover_from_journal() == [os.path.abspath('foo.py')]
+    with open('foo.py') as f:
+        assert f.read() == file_to_mutate_contents
+    assert not os.path.exists('foo.py.bak')
+    assert not os.path.exists('.mutmut-journal')
+    assert recover_from_journal() == []
+
+
+def test_cache_gc(filesystem):
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0"], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+
+    from mutmut.cache import cache_row_counts, orphan_ratio
+    assert orphan_ratio() == 0.0
+
+    os.rename('foo.py', 'bar.py')
+    assert orphan_ratio() == 1.0
+
+    result = CliRunner().invoke(climain, ['cache', 'gc'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    assert 'Mutant: 0 rows, removed {}'.format(EXPECTED_MUTANTS) in result.output
+    assert 'reclaimed' in result.output
+    assert cache_row_counts() == dict(SourceFile=0, Line=0, Mutant=0, ContentResult=EXPECTED_MUTANTS)
+
+
+def test_results_summary(filesystem):
+    with open(os.path.join(str(filesystem), "tests", "test_foo.py"), 'w') as f:
+        f.write(test_file_contents.replace('assert foo(2, 2) is False\n', ''))
+
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0"], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 2
+
+    result = CliRunner().invoke(climain, ['results', '--summary'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    assert 'Killed 🎉: {}'.format(EXPECTED_MUTANTS - 1) in result.output
+    assert 'Survived 🙁: 1' in result.output
+    assert 'Total: {}'.format(EXPECTED_MUTANTS) in result.output
+
+    result = CliRunner().invoke(climain, ['show', 'all'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    assert '-    return a < b\n+    return a <= b' in result.output
+
+
+def test_junitxml_policies(filesystem):
+    with open(os.path.join(str(filesystem), "tests", "test_foo.py"), 'w') as f:
+        f.write(test_file_contents.replace('assert foo(2, 2) is False\n', ''))
+
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-multiplier=0.0"], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 10
+
+    result = CliRunner().invoke(climain, ['junitxml', '--suspicious-policy=error'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    root = ET.fromstring(result.output.strip())
+    assert int(root.attrib['tests']) == EXPECTED_MUTANTS
+    assert int(root.attrib['failures']) == 1
+    assert int(root.attrib['errors']) == EXPECTED_MUTANTS - 1
+    testcases = root.findall('testsuite/testcase')
+    assert len(testcases) == EXPECTED_MUTANTS
+    failure = root.find('testsuite/testcase/failure')
+    assert failure.attrib['message'] == 'bad_survived'
+    assert '+    return a <= b' in failure.text
+    assert testcases[0].find('system-out').text == '    return a < b'
+
+
+def test_junitxml_skips_deleted_files(filesystem):
+    with open('bar.py', 'w') as f:
+        f.write('def bar():\n    return 1 + 1\n')
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py,bar.py', "--test-time-base=15.0"], catch_exceptions=False)
+    print(repr(result.output))
+    result = CliRunner().invoke(climain, ['junitxml'], catch_exceptions=False)
+    assert int(ET.fromstring(result.output.strip()).attrib['tests']) > EXPECTED_MUTANTS
+    os.remove('bar.py')
+
+    result = CliRunner().invoke(climain, ['junitxml'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    root = ET.fromstring(result.output.strip())
+    assert int(root.attrib['tests']) == EXPECTED_MUTANTS
+    testcases = root.findall('testsuite/testcase')
+    assert len(testcases) == EXPECTED_MUTANTS
+    assert {x.attrib['file'] for x in testcases} == {'foo.py'}
+
+
+def test_html_report_is_incremental(filesystem):
+    with open('bar.py', 'w') as f:
+        f.write('def bar():\n    return 1 + 1\n')
+
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py,bar.py', "--test-time-base=15.0"], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 2
+
+    result = CliRunner().invoke(climain, ['html'], catch_exceptions=False)
+    assert result.exit_code == 0
+    with open('html/bar.py.html') as f:
+        assert '<h2>Survived</h2>' in f.read()
+    with open('html/index.html') as f:
+        assert 'Killed {} out of {} mutants'.format(EXPECTED_MUTANTS, EXPECTED_MUTANTS + 3) in f.read()
+
+    for filename in ['html/foo.py.html', 'html/bar.py.html']:
+        with open(filename, 'w') as f:
+            f.write('not written again')
+
+    # nothing changed, so no page is written again
+    result = CliRunner().invoke(climain, ['html'], catch_exceptions=False)
+    assert result.exit_code == 0
+    for filename in ['html/foo.py.html', 'html/bar.py.html']:
+        with open(filename) as f:
+            assert f.read() == 'not written again'
+
+    with open('bar.py', 'a') as f:
+        f.write('\n')
+    result = CliRunner().invoke(climain, ['html'], catch_exceptions=False)
+    assert result.exit_code == 0
+    with open('html/foo.py.html') as f:
+        assert f.read() == 'not written again'
+    with open('html/bar.py.html') as f:
+        assert '<h2>Survived</h2>' in f.read()
+
+
+def test_export(filesystem):
+    with open(os.path.join(str(filesystem), "tests", "test_foo.py"), 'w') as f:
+        f.write(test_file_contents.replace('assert foo(2, 2) is False\n', ''))
+
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0"], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 2
+
+    result = CliRunner().invoke(climain, ['export'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    rows = [json.loads(x) for x in result.output.splitlines()]
+    assert len(rows) == EXPECTED_MUTANTS
+    survived = [x for x in rows if x['status'] == 'bad_survived']
+    assert len(survived) == 1
+    assert survived[0]['filename'] == 'foo.py'
+    assert survived[0]['line_number'] == 2
+    assert survived[0]['line'] == '    return a < b'
+    assert survived[0]['operator'] == 'operator'
+    assert survived[0]['duration'] > 0
+    assert '+    return a <= b' in survived[0]['diff']
+
+    result = CliRunner().invoke(climain, ['export', '--format=json', '--since=last'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    assert json.loads(result.output) == []
+
+
+def test_stats(filesystem):
+    result = CliRunner().invoke(climain, ['stats'], catch_exceptions=False)
+    assert result.exit_code == 0
+    assert 'No timings in the cache yet' in result.output
+
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0"], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+
+    result = CliRunner().invoke(climain, ['stats'], catch_exceptions=False)
+    print(result.output)
+    assert result.exit_code == 0
+    assert 'Timed mutants: {}'.format(EXPECTED_MUTANTS) in result.output
+    assert 'mutmut overhead: ' in result.output
+    assert 'Timeouts: 0 costing 0.0s' in result.output
+    assert 'foo.py' in result.output.split('Slowest files:')[1]
+    assert 'number' in result.output.split('Slowest operators:')[1]
+
+
+def test_status_file(filesystem):
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0", '--status-file=status.json'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+
+    with open('status.json') as f:
+        status = json.load(f)
+    assert status['total'] == EXPECTED_MUTANTS
+    assert status['done'] == EXPECTED_MUTANTS
+    assert status['tested_this_run'] == EXPECTED_MUTANTS
+    assert status['counts']['killed'] == EXPECTED_MUTANTS
+    assert status['mutants_per_second'] > 0
+    assert status['eta_seconds'] == 0
+    assert status['workers'] == []
+    assert set(status['queues']) == {'mutants', 'results'}
+    assert not os.path.exists('status.json.tmp')
+
+
+def test_trace(filesystem):
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0", '--trace=run.json'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+
+    with open('run.json') as f:
+        trace = json.load(f)
+    events = trace['traceEvents']
+    names = [event['name'] for event in events]
+    assert 'baseline' in names
+    assert 'discovery' in names
+    assert 'queue_mutants' in names
+    assert 'cache lookup foo.py' in names
+    assert names.count('update_mutant_status') == EXPECTED_MUTANTS
+    assert names.count('tests') == EXPECTED_MUTANTS
+
+    mutants = [event for event in events if event.get('cat') == 'mutant' and event['name'].startswith('foo.py:')]
+    assert len(mutants) == EXPECTED_MUTANTS
+    assert all(event['ph'] == 'X' and event['dur'] >= 0 and event['args']['status'] == 'ok_killed' for event in mutants)
+    assert all(event['pid'] != os.getpid() for event in mutants)
+
+
+def test_profile_mutmut(filesystem):
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0", '--profile-mutmut'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    assert 'Profile of mutmut merged from ' in result.output
+    assert 'ncalls' in result.output
+
+    profiles = sorted(os.listdir('.mutmut-profile'))
+    assert 'main-{}.pstats'.format(os.getpid()) in profiles
+    assert any(name.startswith('worker-') for name in profiles)
+
+
+def test_progress_is_rate_limited(capsys):
+    progress = Progress(total=3, interval=60.0, is_tty=True)
+    progress.register('ok_killed')
+    progress.register('bad_survived')
+    progress.register('ok_killed')
+    output = capsys.readouterr().out
+    assert output.count('/3') == 1
+    assert '1/3  🎉 1  ⏰ 0  🤔 0  🙁 0  🔇 0' in output
+
+    progress.finish()
+    assert '3/3  🎉 2  ⏰ 0  🤔 0  🙁 1  🔇 0' in capsys.readouterr().out
+
+
+def test_progress_prints_summary_lines_without_tty(capsys):
+    progress = Progress(total=2, summary_interval=60.0, is_tty=False)
+    progress.register('ok_killed')
+    progress.register('ok_killed')
+    progress.finish()
+    assert capsys.readouterr().out == '1/2  🎉 1  ⏰ 0  🤔 0  🙁 0  🔇 0\n2/2  🎉 2  ⏰ 0  🤔 0  🙁 0  🔇 0\n'
+
+
+def test_output_tail_of_survivors_is_stored(filesystem):
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0", '--runner', '{} -c "print(\'all good\')"'.format(sys.executable)], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 2
+    assert 'all good' not in result.output
+
+    result = CliRunner().invoke(climain, ['show', '1'], catch_exceptions=False)
+    print(result.output)
+    assert 'Tail of the test output:\nall good' in result.output
+
+
+def test_selected_tests():
+    test_durations = {
+        'tests/test_a.py::test_1': 0.1,
+        'tests/test_a.py::test_2': 0.2,
+        'tests/test_b.py::test_1': 0.3,
+        'other/test_c.py::test_1': 0.4,
+    }
+    assert selected_tests('python -m pytest -x', test_durations) is None
+    assert selected_tests('python -m pytest -x tests/test_a.py', test_durations) == ['tests/test_a.py::test_1', 'tests/test_a.py::test_2']
+    assert selected_tests('python -m pytest ./tests/test_b.py::test_1 other/test_c.py', test_durations) == ['tests/test_b.py::test_1', 'other/test_c.py::test_1']
+    assert selected_tests('python -m pytest tests/test_unknown.py', test_durations) is None
+
+
+def test_baseline_records_test_durations(filesystem):
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0", '--runner', PYTHON + ' -m pytest -x -p no:cacheprovider'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+
+    from mutmut.cache import cached_test_durations
+    assert list(cached_test_durations()) == ['tests/test_foo.py::test_foo']
+
+
+def test_pytest_plugin_kills_slow_tests(tmpdir):
+    os.chdir(str(tmpdir))
+    with open('test_slow.py', 'w') as f:
+        f.write('import time\ndef test_slow():\n    time.sleep(30)\n')
+    write_time_limits('time_limits.json', {'test_slow.py::test_slow': 0.01}, multiplier=10, minimum=0.5)
+
+    start = time()
+    with pytest_plugin_environment('python -m pytest', MUTMUT_TEST_TIME_LIMITS='time_limits.json'):
+        returncode = popen_streaming_output(PYTHON + ' -m pytest test_slow.py -p no:cacheprovider', lambda line: line)
+    assert returncode == 124
+    assert time() - start < 10
+    assert 'mutmut_pytest_plugin' not in os.environ.get('PYTEST_ADDOPTS', '')
+
+
+def test_baseline_monitor_recalibrates_on_drift():
+    class MockConfig:
+        baseline_time_elapsed = 1.0
+
+    config = MockConfig()
+    monitor = BaselineMonitor(config, dispersion=0.1, minimum_samples=3)
+
+    # killed mutants that stop early are no drift
+    for duration in [0.2, 0.3, 0.2, 0.4]:
+        assert monitor.register('ok_killed', duration) is None
+    assert config.baseline_time_elapsed == 1.0
+
+    assert monitor.register('bad_survived', 2.0) is None
+    assert monitor.register('bad_survived', 2.2) is None
+    assert monitor.register('bad_survived', 2.1) == 2.1
+    assert config.baseline_time_elapsed == 2.1
+
+    # killed mutants slower than the whole baseline show drift too
+    for duration in [3.5, 3.6]:
+        assert monitor.register('ok_killed', duration) is None
+    assert monitor.register('ok_killed', 3.7) == 3.6
+
+
+def test_baseline_monitor_ignores_suspicious_mutants():
+    class MockConfig:
+        baseline_time_elapsed = 1.0
+
+    config = MockConfig()
+    monitor = BaselineMonitor(config)
+    for duration in [2.1, 2.2, 2.3, 2.4, 2.5]:
+        assert monitor.register('ok_suspicious', duration) is None
+    assert config.baseline_time_elapsed == 1.0
+
+
+def test_baseline_runs(filesystem):
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0", '--baseline-runs=3'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    assert 'Done, median of 3 runs: ' in result.output
+
+    from mutmut.cache import cached_test_time_dispersion
+    assert cached_test_time_dispersion() >= 0.0
+
+
+def test_collect_coverage(filesystem):
+    with open(os.path.join(str(filesystem), "tests", "test_foo.py"), 'w') as f:
+        f.write(test_file_contents.replace('assert foo(1, 2) is True\n', '').replace('assert foo(2, 2) is False\n', ''))
+
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0", "--collect-coverage"], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    # the mutants in the body of foo() are not covered by the tests
+    assert '13/13  🎉 13  ⏰ 0  🤔 0  🙁 0' in repr(result.output)
+
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--collect-coverage", "--use-coverage"], catch_exceptions=False)
+    assert result.exit_code == 2
+
+
+def test_collect_coverage_with_pytest_cov(filesystem):
+    with open(os.path.join(str(filesystem), "tests", "test_foo.py"), 'w') as f:
+        f.write(test_file_contents.replace('assert foo(1, 2) is True\n', '').replace('assert foo(2, 2) is False\n', ''))
+
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0", "--collect-coverage", '--runner', 'python -m pytest -x -p no:cacheprovider --cov=. tests'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    assert '13/13  🎉 13  ⏰ 0  🤔 0  🙁 0' in repr(result.output)
+
+
+def test_collect_coverage_of_nothing_to_mutate(filesystem):
+    with open(os.path.join(str(filesystem), "tests", "test_foo.py"), 'w') as f:
+        f.write('def test_nothing():\n    pass\n')
+
+    with pytest.raises(RuntimeError, match='No lines of foo.py ran'):
+        CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--collect-coverage"], catch_exceptions=False)
+
+
+@pytest.mark.parametrize(
+    "selector, expected",
+    [
+        ('foo.py::foo', '1/1  🎉 1  ⏰ 0  🤔 0  🙁 0'),
+        ('foo.py:3-4', '5/5  🎉 5  ⏰ 0  🤔 0  🙁 0'),
+        ('f*.py::f??', '1/1  🎉 1  ⏰ 0  🤔 0  🙁 0'),
+    ]
+)
+def test_run_target_selector(filesystem, selector, expected):
+    result = CliRunner().invoke(climain, ['run', selector, '--paths-to-mutate=foo.py', "--test-time-base=15.0"], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    assert expected in repr(result.output)
+
+    result = CliRunner().invoke(climain, ['run', 'bar.py::foo', '--paths-to-mutate=foo.py'], catch_exceptions=False)
+    assert result.exit_code == 2
+
+
+def test_sample_mutations_is_stratified():
+    mutations_by_file = {
+        'a.py': [RelativeMutationID('a', i, i, operator='number') for i in range(60)] + [RelativeMutationID('b', i, i, operator='string') for i in range(20)],
+        'b.py': [RelativeMutationID('c', i, i, operator='number') for i in range(20)],
+    }
+    sample = sample_mutations(mutations_by_file, 10, seed=1)
+    assert sum(x.operator == 'number' for x in sample['a.py']) == 6
+    assert sum(x.operator == 'string' for x in sample['a.py']) == 2
+    assert len(sample['b.py']) == 2
+    assert sample == sample_mutations(mutations_by_file, 10, seed=1)
+    assert sample != sample_mutations(mutations_by_file, 10, seed=2)
+
+    # the shares are rounded so they add up to the sample size
+    assert sum(len(x) for x in sample_mutations(mutations_by_file, 7, seed=1).values()) == 7
+    assert sample_mutations(mutations_by_file, 1000, seed=1) == mutations_by_file
+
+
+def test_sample_mutations_of_identical_files():
+    mutations = [RelativeMutationID('a = {}'.format(i), 0, i, operator='number') for i in range(10)]
+    mutations_by_file = {
+        'foo.py': mutations,
+        'bar.py': [RelativeMutationID(x.line, x.index, x.line_number, operator=x.operator) for x in mutations],
+    }
+    for seed in range(10):
+        sample = sample_mutations(mutations_by_file, 2, seed=seed)
+        assert len(sample['foo.py']) == 1
+        assert len(sample['bar.py']) == 1
+
+
+def test_estimate_mutation_score():
+    progress = Progress(total=100)
+    assert estimate_mutation_score(progress, 1000) is None
+
+    progress.killed_mutants = 70
+    progress.suspicious_mutants = 10
+    progress.surviving_mutants = 20
+    progress.skipped = 5
+    score, low, high = estimate_mutation_score(progress, 1000)
+    assert score == 0.8
+    assert 0.7 < low < 0.8 < high < 0.9
+    # a bigger share of the population gives a narrower interval
+    _, low2, high2 = estimate_mutation_score(progress, 200)
+    assert low < low2 < high2 < high
+    assert estimate_mutation_score(progress, 100) == (0.8, 0.8, 0.8)
+
+
+def test_run_sample(filesystem):
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0", '--sample-count=5', '--sample-seed=3'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    assert 'Sampled 5 of {} mutants, use --sample-seed=3'.format(EXPECTED_MUTANTS) in result.output
+    assert '5/5  🎉 5  ⏰ 0  🤔 0  🙁 0' in repr(result.output)
+    assert 'Estimated mutation score: 100.0% (95% confidence interval ' in result.output
+
+    # the sampled results are cached
+    result = CliRunner().invoke(climain, ['results', '--summary'], catch_exceptions=False)
+    assert 'Killed 🎉: 5' in result.output
+    assert 'Untested: {}'.format(EXPECTED_MUTANTS - 5) in result.output
+
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', '--sample=5%', '--sample-count=5'], catch_exceptions=False)
+    assert result.exit_code == 2
+
+
+def test_sequential_test():
+    sequential_test = SequentialTest(0.7, 0.8, confidence=0.95)
+    progress = Progress(total=1000)
+    assert sequential_test.verdict(progress) is None
+
+    progress.killed_mutants = 8
+    progress.surviving_mutants = 2
+    assert sequential_test.verdict(progress) is None
+    assert sequential_test.final_verdict(progress) == SequentialTest.PASSED
+
+    progress.killed_mutants = 100
+    assert sequential_test.verdict(progress) == SequentialTest.PASSED
+
+    progress.killed_mutants = 50
+    progress.surviving_mutants = 50
+    assert sequential_test.verdict(progress) == SequentialTest.FAILED
+
+    # skipped mutants don't count
+    progress.skipped = 1000
+    assert sequential_test.verdict(progress) == SequentialTest.FAILED
+
+    with pytest.raises(ValueError):
+        SequentialTest(0.8, 0.7)
+
+    assert compute_exit_code(progress, verdict=SequentialTest.PASSED) == 0
+    assert compute_exit_code(progress, verdict=SequentialTest.FAILED) == 2
+    assert compute_exit_code(progress, Exception(), verdict=SequentialTest.PASSED) == 1
+
+
+def test_run_stops_when_the_verdict_is_settled(filesystem):
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0", '--fail-under=20', '--pass-over=50', '--verdict-confidence=0.9'], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    assert 'Stopped after 3 of {} mutants, the rest are untested'.format(EXPECTED_MUTANTS) in result.output
+    assert 'The mutation score is over 50.0%' in result.output
+
+    with open('foo.py') as f:
+        assert f.read() == file_to_mutate_contents
+    assert not os.path.exists('foo.py.bak')
+    assert not os.path.exists('.mutmut-journal')
+
+    result = CliRunner().invoke(climain, ['results', '--summary'], catch_exceptions=False)
+    assert 'Killed 🎉: 3' in result.output
+    assert 'Untested: {}'.format(EXPECTED_MUTANTS - 3) in result.output
+
+
+def test_run_stops_early_with_a_full_queue(tmpdir):
+    # enough mutants of a big enough file to fill the pipe to the worker
+    os.chdir(str(tmpdir))
+    mkdir('tests')
+    with open('foo.py', 'w') as f:
+        f.write(''.join('x_{0} = {0}\n'.format(i) for i in range(1500)))
+    with open(join('tests', 'test_foo.py'), 'w') as f:
+        f.write('import foo\n\ndef test_foo():\n    for i in range(1500):\n        assert getattr(foo, "x_%d" % i) == i\n')
+
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = subprocess.run(
+        [sys.executable, '-m', 'mutmut', 'run', '--paths-to-mutate=foo.py', '--runner', PYTHON + ' -m pytest -x -q', '--fail-under=10', '--pass-over=90'],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=120,
+    )
+    output = result.stdout.decode()
+    print(output)
+    assert result.returncode == 0
+    assert 'Stopped after ' in output
+
+
+def test_collect_coverage_and_use_patch_file(filesystem):
+    with open(os.path.join(str(filesystem), "tests", "test_foo.py"), 'w') as f:
+        f.write(test_file_contents.replace('assert foo(1, 2) is True\n', '').replace('assert foo(2, 2) is False\n', ''))
+    with open('patch', 'w') as f:
+        f.write("""diff --git a/foo.py b/foo.py
+index c6a496c..b9a5fb4 100644
+--- a/foo.py
++++ b/foo.py
+@@ -1,6 +1,6 @@
+ def foo(a, b):
+-    return a <= b
++    return a < b
+ c = 1
+ c += 1
+ e = 1
+-f = 5
++f = 3
+""")
+
+    # only the change of f is covered
+    result = CliRunner().invoke(climain, ['run', '--paths-to-mutate=foo.py', "--test-time-base=15.0", "--collect-coverage", "--use-patch-file=patch"], catch_exceptions=False)
+    print(repr(result.output))
+    assert result.exit_code == 0
+    assert '2/2  🎉 2  ⏰ 0  🤔 0  🙁 0' in repr(result.output)
@@ -366,3 +366,29 @@ def test_bad_mutation_str_type_definition():
 foo: 'SomeType'
     """
     assert mutate(Context(source=source)) == (source, 0)
+
+
+def test_mutate_reusing_parsed_tree():
+    from mutmut.cache import unified_diffs_of_file, _get_unified_diff
+    source = "def foo(a, b):\n    return a < b and not c\nd = dict(e=f)\ng: int = 2 * 3\n"
+    mutation_ids = list_mutations(Context(source=source))
+    assert len(mutation_ids) > 5
+    expected = [_get_unified_diff(source, 'foo.py', x, None, update_cache=False) for x in mutation_ids]
+    assert list(unified_diffs_of_file('foo.py', source, mutation_ids, None)) == expected
+
+
+def test_mutation_operators():
+    mutation_ids = list_mutations(Context(source='x = 1 + a and True\n'))
+    assert [x.operator for x in mutation_ids] == ['number', 'operator', 'keyword', 'and_or_test', 'expression']
+
+
+def test_skip_statements_outside_of_the_covered_lines():
+    from unittest.mock import MagicMock
+    source = "def foo(a, b):\n    return a < b\n\n\nclass Bar:\n    x = 1\n\n    def baz(self):\n        return self.x + 2\n"
+    all_mutation_ids = list_mutations(Context(source=source, filename='foo.py'))
+
+    for lines in [{2}, {6}, {9}, {2, 9}, set(range(5, 10))]:
+        config = MagicMock()
+        config.covered_lines_by_filename = {'foo.py': lines}
+        mutation_ids = list_mutations(Context(source=source, filename='foo.py', config=config))
+        assert mutation_ids == [x for x in all_mutation_ids if x.line_number + 1 in lines]